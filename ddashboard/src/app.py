@@ -1,16 +1,38 @@
 # src/app.py
 
+import functools
+import os
 import dash
+import networkx as nx
 from dash import dcc, html, Input, Output, State, callback_context
 import dash_bootstrap_components as dbc
-from topic_query import TopicModel
+from topic_query import open_topic_model
+from response_cache import TTLCache, cached_response
 from dash.dependencies import ALL
 import dash_cytoscape as cyto
 
-# Initialize model (adjust path as needed)
-model = TopicModel('topic_graph.gpickle')
+# Initialize model (adjust path as needed); a topic store directory opens lazily and is preferred
+STORE_PATH = 'topic_store'
+GRAPH_PATH = 'topic_graph.gpickle'
+INDEX_PATH = 'topic_index.npz'
+CORPUS_PATH = 'corpus.txt'
+model = open_topic_model(
+    STORE_PATH if os.path.isdir(STORE_PATH) else GRAPH_PATH,
+    index_path=INDEX_PATH if os.path.exists(INDEX_PATH) else None,
+    corpus_path=CORPUS_PATH if os.path.exists(CORPUS_PATH) else None,
+)
+
+LEVELS = model.get_levels()
+
+# Rendered callback responses, keyed by their inputs (e.g. topic and level); per worker process
+RESPONSE_CACHE = TTLCache(
+    maxsize=int(os.environ.get('RESPONSE_CACHE_SIZE', 4096)),
+    ttl=float(os.environ.get('RESPONSE_CACHE_TTL', 600)),
+)
 
 app = dash.Dash(__name__, external_stylesheets=[dbc.themes.BOOTSTRAP])
+# WSGI callable for production servers, see wsgi.py
+server = app.server
 
 def topic_dropdown(level):
     topics = model.get_topic_list(level)
@@ -36,6 +58,11 @@ COMMUNITY_COLORS = [
     '#8c564b', '#e377c2', '#7f7f7f', '#bcbd22', '#17becf'
 ]
 
+# Community view: one node per community, heaviest edges only, positions computed on the server
+MAX_COMMUNITY_EDGES = 200
+LAYOUT_SCALE = 400
+MIN_NODE_DIAMETER, MAX_NODE_DIAMETER = 20, 80
+
 def get_community_color(comm):
     try:
         return COMMUNITY_COLORS[int(comm) % len(COMMUNITY_COLORS)]
@@ -47,8 +74,8 @@ app.layout = dbc.Container([
     html.Label("Select Level:"),
     dcc.Dropdown(
         id='level-dropdown',
-        options=[{'label': f"Level {lvl}", 'value': lvl} for lvl in model.get_levels()],
-        value=model.get_levels()[0] if model.get_levels() else None
+        options=[{'label': f"Level {lvl}", 'value': lvl} for lvl in LEVELS],
+        value=LEVELS[0] if LEVELS else None
     ),
     html.Br(),
     html.Label("Select Topic:"),
@@ -60,9 +87,19 @@ app.layout = dbc.Container([
     html.Ul(id='subtopic-list'),
     html.Hr(),
     html.H4("Graph View"),
+    dcc.RadioItems(
+        id='graph-mode',
+        options=[
+            {'label': ' Communities', 'value': 'community'},
+            {'label': ' Terms', 'value': 'term'}
+        ],
+        value='community',
+        inline=True,
+        inputStyle={'marginLeft': '12px'}
+    ),
     cyto.Cytoscape(
         id='topic-graph',
-        layout={'name': 'cose'},
+        layout={'name': 'preset'},
         style={'width': '100%', 'height': '500px'},
         elements=[],
         stylesheet=[
@@ -73,6 +110,8 @@ app.layout = dbc.Container([
                 for i, color in enumerate(COMMUNITY_COLORS)
             ],
             {'selector': 'node', 'style': {'text-wrap': 'wrap', 'text-max-width': 80}},
+            {'selector': '.community', 'style': {'width': 'data(diameter)', 'height': 'data(diameter)'}},
+            {'selector': '.community-edge', 'style': {'width': 'data(width)', 'target-arrow-shape': 'none'}},
             {'selector': 'edge', 'style': {'curve-style': 'bezier', 'target-arrow-shape': 'triangle'}}
         ]
     ),
@@ -134,6 +173,7 @@ def update_topic_dropdown_and_navigate(level, n_clicks_list, node_data, ids, cur
     Input('topic-dropdown', 'value'),
     Input('level-dropdown', 'value')
 )
+@cached_response(RESPONSE_CACHE)
 def display_topic_details(topic_id, level):
     if not topic_id or level is None:
         return "Select a topic to see details.", []
@@ -167,7 +207,7 @@ def display_topic_details(topic_id, level):
         html.Div([
             html.H3(f"Topic {details['id']} (Level {details['level']})"),
             html.P(f"Keywords: {', '.join(kws)}"),
-            html.P(f"Documents: {len(docs)}"),
+            html.P(f"Documents: {details.get('document_count', len(docs))}"),
             html.H5("Sample Documents:"),
             html.Ul([html.Li(snip) for snip in snippets])
         ]),
@@ -181,11 +221,44 @@ def display_topic_details(topic_id, level):
         ) for sub in subs]
     )
 
-@app.callback(
-    Output('topic-graph', 'elements'),
-    Input('level-dropdown', 'value')
-)
-def update_graph_elements(level):
+@functools.lru_cache(maxsize=None)
+def community_elements(level):
+    """Cytoscape elements with one preset-positioned node per community at ``level``.
+
+    Each node is keyed by the community's top keyword, so tapping it opens that topic. Computed
+    once per level and cached; the model's data is read-only.
+    """
+    overview = model.get_community_graph(level, max_edges=MAX_COMMUNITY_EDGES)
+    communities = overview['communities']
+    if not communities:
+        return []
+    layout_graph = nx.Graph()
+    layout_graph.add_nodes_from(c['community'] for c in communities)
+    layout_graph.add_weighted_edges_from(overview['edges'])
+    positions = nx.spring_layout(layout_graph, weight='weight', seed=0, scale=LAYOUT_SCALE)
+    largest = max(c['size'] for c in communities)
+    lead = {c['community']: c['keywords'][0] for c in communities}
+    nodes = [{
+        'data': {
+            'id': lead[c['community']],
+            'label': f"Community {c['community']} ({c['size']})\n{', '.join(c['keywords'])}",
+            'community': c['community'],
+            'size': c['size'],
+            'diameter': MIN_NODE_DIAMETER + (MAX_NODE_DIAMETER - MIN_NODE_DIAMETER) * c['size'] / largest,
+            'tooltip': ', '.join(c['keywords'])
+        },
+        'position': {'x': float(positions[c['community']][0]), 'y': float(positions[c['community']][1])},
+        'classes': f"community comm-{c['community']}"
+    } for c in communities]
+    heaviest = max((w for _, _, w in overview['edges']), default=1)
+    edges = [{
+        'data': {'source': lead[a], 'target': lead[b], 'weight': w, 'width': 1 + 7 * w / heaviest},
+        'classes': 'community-edge'
+    } for a, b, w in overview['edges']]
+    return nodes + edges
+
+@functools.lru_cache(maxsize=None)
+def term_elements(level):
     topics = model.get_topic_list(level)
     nodes = []
     for t in topics:
@@ -219,7 +292,19 @@ def update_graph_elements(level):
             edges.append({'data': {'source': t['id'], 'target': sub}})
     return nodes + edges
 
+@app.callback(
+    Output('topic-graph', 'elements'),
+    Output('topic-graph', 'layout'),
+    Input('level-dropdown', 'value'),
+    Input('graph-mode', 'value')
+)
+@cached_response(RESPONSE_CACHE)
+def update_graph_elements(level, mode):
+    if mode == 'community':
+        return community_elements(level), {'name': 'preset'}
+    return term_elements(level), {'name': 'cose'}
 
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # Development server; set DASH_DEBUG=1 for hot reload and the debug UI. Use wsgi.py in production.
+    app.run(debug=os.environ.get('DASH_DEBUG') == '1')
\ No newline at end of file
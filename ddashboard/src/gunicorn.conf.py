@@ -0,0 +1,12 @@
+# src/gunicorn.conf.py
+
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8050')
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+# Import the app (and load the topic data) once before forking workers
+preload_app = True
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 60))
+accesslog = '-'
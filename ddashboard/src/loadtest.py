@@ -0,0 +1,132 @@
+# src/loadtest.py
+#
+# Fire concurrent Dash callback requests at a running dashboard and report latency percentiles:
+#
+#     python loadtest.py --url http://localhost:8050 --requests 2000 --concurrency 32
+#
+# Topics and levels are sampled from the same topic data the dashboard serves.
+
+import argparse
+import json
+import os
+import random
+import time
+import urllib.request
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from topic_query import open_topic_model
+
+
+def details_payload(topic_id, level):
+    return {
+        'output': '..topic-details.children...subtopic-list.children..',
+        'outputs': [
+            {'id': 'topic-details', 'property': 'children'},
+            {'id': 'subtopic-list', 'property': 'children'},
+        ],
+        'inputs': [
+            {'id': 'topic-dropdown', 'property': 'value', 'value': topic_id},
+            {'id': 'level-dropdown', 'property': 'value', 'value': level},
+        ],
+        'changedPropIds': ['topic-dropdown.value'],
+        'state': [],
+    }
+
+
+def graph_payload(level, mode):
+    return {
+        'output': '..topic-graph.elements...topic-graph.layout..',
+        'outputs': [
+            {'id': 'topic-graph', 'property': 'elements'},
+            {'id': 'topic-graph', 'property': 'layout'},
+        ],
+        'inputs': [
+            {'id': 'level-dropdown', 'property': 'value', 'value': level},
+            {'id': 'graph-mode', 'property': 'value', 'value': mode},
+        ],
+        'changedPropIds': ['level-dropdown.value'],
+        'state': [],
+    }
+
+
+def post(url, payload, timeout):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'}
+    )
+    start = time.perf_counter()
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        response.read()
+    return time.perf_counter() - start
+
+
+def build_requests(model, n_requests, graph_share, mode, seed):
+    rng = random.Random(seed)
+    levels = model.get_levels()
+    topics = {level: [t['id'] for t in model.get_topic_list(level)] for level in levels}
+    levels = [level for level in levels if topics[level]]
+    if not levels:
+        raise SystemExit('No topics to request')
+    work = []
+    for _ in range(n_requests):
+        level = rng.choice(levels)
+        if rng.random() < graph_share:
+            work.append(('update_graph_elements', graph_payload(level, mode)))
+        else:
+            work.append(('display_topic_details', details_payload(rng.choice(topics[level]), level)))
+    return work
+
+
+def report(latencies, errors, elapsed):
+    print(f"{'callback':<24}{'n':>7}{'errors':>8}{'mean':>9}{'p50':>9}{'p90':>9}{'p95':>9}{'p99':>9}{'max':>9}  (ms)")
+    for name in sorted(set(latencies) | set(errors)):
+        ms = np.array(latencies.get(name, [])) * 1000
+        if len(ms):
+            p50, p90, p95, p99 = np.percentile(ms, [50, 90, 95, 99])
+            stats = f"{ms.mean():>9.1f}{p50:>9.1f}{p90:>9.1f}{p95:>9.1f}{p99:>9.1f}{ms.max():>9.1f}"
+        else:
+            stats = ''
+        print(f"{name:<24}{len(ms):>7}{errors.get(name, 0):>8}{stats}")
+    total = sum(len(values) for values in latencies.values())
+    print(f"{total} successful requests in {elapsed:.1f}s ({total / elapsed:.1f} req/s)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the dashboard callbacks')
+    parser.add_argument('--url', default='http://localhost:8050')
+    parser.add_argument('--data', default='topic_store' if os.path.isdir('topic_store') else 'topic_graph.gpickle',
+                        help='Topic store or pickled graph used to sample topic ids')
+    parser.add_argument('--requests', type=int, default=1000)
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--graph-share', type=float, default=0.2,
+                        help='Fraction of requests hitting update_graph_elements')
+    parser.add_argument('--mode', choices=['community', 'term'], default='community')
+    parser.add_argument('--timeout', type=float, default=30.0)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    work = build_requests(open_topic_model(args.data), args.requests, args.graph_share, args.mode, args.seed)
+    url = args.url.rstrip('/') + '/_dash-update-component'
+    latencies, errors = defaultdict(list), defaultdict(int)
+
+    def run(item):
+        name, payload = item
+        try:
+            return name, post(url, payload, args.timeout)
+        except Exception:
+            return name, None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for name, latency in pool.map(run, work):
+            if latency is None:
+                errors[name] += 1
+            else:
+                latencies[name].append(latency)
+    report(latencies, errors, time.perf_counter() - start)
+
+
+if __name__ == '__main__':
+    main()
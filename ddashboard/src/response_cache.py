@@ -0,0 +1,63 @@
+# src/response_cache.py
+
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+
+class TTLCache:
+    """Thread-safe LRU cache whose entries also expire ``ttl`` seconds after being stored."""
+
+    def __init__(self, maxsize: int = 1024, ttl: float = 300.0):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return ``(True, value)`` for a live entry, ``(False, None)`` otherwise."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return False, None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self._entries[key]
+                return False, None
+            self._entries.move_to_end(key)
+            return True, value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def cached_response(cache: TTLCache):
+    """Memoize a Dash callback on its positional arguments (e.g. ``(topic_id, level)``).
+
+    Cached values are shared between requests, so the callback must not depend on
+    ``callback_context`` or any other per-request state.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args):
+            key = (func.__name__, *args)
+            hit, value = cache.get(key)
+            if not hit:
+                value = func(*args)
+                cache.set(key, value)
+            return value
+        wrapper.cache = cache
+        return wrapper
+    return decorator
@@ -1,61 +1,416 @@
 # src/topic_query.py
 
+import functools
+import json
+import os
+import sys
 import networkx as nx
+import numpy as np
+from collections import defaultdict
 from typing import List, Dict, Any, Optional
 
+# Documents are read through the pipeline's DocumentStore, which owns the <corpus>.offsets cache
+PIPELINE_DIR = os.environ.get(
+    'KG_PIPELINE_DIR',
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'experiment', 'cooccurrence'),
+)
+if PIPELINE_DIR not in sys.path:
+    sys.path.append(PIPELINE_DIR)
+
+from document_store import DocumentStore
+
+
+class CorpusLines(DocumentStore):
+    """Random access to the documents of a one-document-per-line corpus, without trailing newlines.
+
+    Shares the memory map and the validated ``<corpus>.offsets.npy`` cache of the pipeline's
+    DocumentStore; empty corpora and read-only locations are handled there.
+    """
+
+    def __getitem__(self, doc_id: int) -> str:
+        return super().__getitem__(doc_id).rstrip("\n")
+
+
+def load_topic_index(index_path: str) -> Dict[int, Dict[str, np.ndarray]]:
+    """Read a TopicDocumentIndex .npz (keys ``L{level}_{array}``) written by the cooccurrence pipeline."""
+    levels = defaultdict(dict)
+    with np.load(index_path) as arrays:
+        for key in arrays.files:
+            level, name = key[1:].split("_", 1)
+            levels[int(level)][name] = arrays[key]
+    return dict(levels)
+
+
+def _posting_documents(postings: Optional[Dict[str, np.ndarray]], comm) -> np.ndarray:
+    """Doc ids listed for community ``comm`` in CSR postings (sorted ``topic_ids``, ``indptr``, ``doc_ids``)."""
+    if comm is None or postings is None:
+        return np.empty(0, dtype=np.int64)
+    pos = int(np.searchsorted(postings['topic_ids'], comm))
+    if pos == len(postings['topic_ids']) or postings['topic_ids'][pos] != comm:
+        return np.empty(0, dtype=np.int64)
+    return postings['doc_ids'][postings['indptr'][pos]:postings['indptr'][pos + 1]]
+
+
+def _memoized(method):
+    """Cache a query's result per arguments; models are read-only, so callers must not mutate results."""
+    @functools.wraps(method)
+    def wrapper(self, *args, **kwargs):
+        key = (method.__name__, args, tuple(sorted(kwargs.items())))
+        if key not in self._memo:
+            self._memo[key] = method(self, *args, **kwargs)
+        return self._memo[key]
+    return wrapper
+
+
 class TopicModel:
-    def __init__(self, graph_path: str):
+    def __init__(self, graph_path: str, index_path: Optional[str] = None, corpus_path: Optional[str] = None):
+        """
+        Documents are resolved by id from ``corpus_path`` (default: the ``corpus_path`` recorded in the
+        graph by assign_documents_to_communities). With ``index_path`` (a saved TopicDocumentIndex)
+        lookups return the top-ranked documents of the topic's community; otherwise the doc ids
+        stored per community in ``graph.graph['community_documents']``, then legacy node lists.
+
+        Topic lists and community members are indexed per level in one pass at load time, and
+        detail queries are memoized, so dashboard callbacks never rescan the graph.
+        """
         import pickle
         with open(graph_path, "rb") as f:
             self.graph = pickle.load(f)
+        self.index = load_topic_index(index_path) if index_path else None
+        corpus_path = corpus_path or self.graph.graph.get('corpus_path')
+        self.corpus = CorpusLines(corpus_path) if corpus_path and os.path.exists(corpus_path) else None
+        self.community_documents = self.graph.graph.get('community_documents', {})
+        # Shared block hierarchy written by assign_subtopics (replaces per-node 'subtopics' lists)
+        self.hierarchy = self.graph.graph.get('hierarchy')
+        self._degree = dict(self.graph.degree())
+        self._topic_lists, self._community_members = self._index_topics()
+        self._memo = {}
+
+    def _index_topics(self):
+        """Topic records per level (``None`` for all topics) and sorted members per (level, community)."""
+        topic_lists = defaultdict(list)
+        community_members = defaultdict(lambda: defaultdict(list))
+        for node in sorted(node for node, data in self.graph.nodes(data=True) if 'levels' in data):
+            data = self.graph.nodes[node]
+            for level in [None, *data['levels']]:
+                topic_lists[level].append({
+                    'id': node,
+                    'community': data['levels'].get(level),
+                    'keywords': data.get('keywords', []),
+                    'size': self._degree[node],
+                    'levels': data['levels']
+                })
+            for level, comm in data['levels'].items():
+                community_members[level][comm].append(node)
+        return dict(topic_lists), {level: dict(members) for level, members in community_members.items()}
+
+    def _co_members(self, topic_id: str, level: int) -> List[str]:
+        """Terms sharing ``topic_id``'s block at ``level``, excluding the topic itself."""
+        comm = self.graph.nodes[topic_id].get('levels', {}).get(level)
+        if comm is None:
+            return []
+        return [member for member in self._community_members[level][comm] if member != topic_id]
+
+    def _ranked_documents(self, topic_id: str, level: Optional[int]) -> Optional[np.ndarray]:
+        """Doc ids of the topic's community at ``level``, best first when indexed.
+
+        Returns None when documents are not stored by id, so callers fall back to node lists.
+        """
+        if self.corpus is None or level is None:
+            return None
+        comm = self.graph.nodes[topic_id].get('levels', {}).get(level)
+        if self.index is None:
+            if level not in self.community_documents:
+                return None
+            return self.community_documents[level].get(comm, np.empty(0, dtype=np.int64))
+        return _posting_documents(self.index.get(level), comm)
+
+    def _community_terms(self, level: int) -> Dict[int, List[tuple]]:
+        """``(term, degree)`` pairs of every community at ``level``."""
+        return {
+            comm: [(member, self._degree[member]) for member in members]
+            for comm, members in self._community_members.get(level, {}).items()
+        }
+
+    def _community_edges(self, level: int):
+        """Source community, target community and weight of every edge with both ends assigned at ``level``."""
+        src, dst, weight = [], [], []
+        for u, v, w in self.graph.edges(data='weight', default=1):
+            comm_u = self.graph.nodes[u].get('levels', {}).get(level)
+            comm_v = self.graph.nodes[v].get('levels', {}).get(level)
+            if comm_u is not None and comm_v is not None:
+                src.append(comm_u)
+                dst.append(comm_v)
+                weight.append(w)
+        return np.array(src, dtype=np.int64), np.array(dst, dtype=np.int64), np.array(weight, dtype=np.float64)
+
+    @_memoized
+    def get_community_graph(self, level: int, top_k: int = 3, max_edges: int = 200) -> Dict[str, Any]:
+        """Terms at ``level`` aggregated into one node per community, for overview graphs.
+
+        Each community carries its size and ``top_k`` highest-degree terms. Edges sum co-occurrence
+        weight between communities as ``(community, community, weight)``, heaviest ``max_edges`` only.
+        """
+        communities = []
+        for comm, terms in sorted(self._community_terms(level).items()):
+            ranked = sorted(terms, key=lambda term: (-term[1], term[0]))
+            communities.append({
+                'community': int(comm),
+                'size': len(terms),
+                'keywords': [term for term, _ in ranked[:top_k]]
+            })
+        src, dst, weight = self._community_edges(level)
+        between = src != dst
+        pairs = np.column_stack([np.minimum(src, dst), np.maximum(src, dst)])[between].reshape(-1, 2)
+        pairs, inverse = np.unique(pairs, axis=0, return_inverse=True)
+        totals = np.bincount(inverse.ravel(), weights=weight[between], minlength=len(pairs))
+        heaviest = np.argsort(-totals, kind='stable')[:max_edges]
+        edges = [
+            (int(a), int(b), float(w))
+            for (a, b), w in zip(pairs[heaviest].tolist(), totals[heaviest].tolist())
+        ]
+        return {'level': level, 'communities': communities, 'edges': edges}
 
     def get_levels(self) -> List[int]:
-        levels = set()
-        for _, data in self.graph.nodes(data=True):
-            if 'levels' in data:
-                levels.update(data['levels'].keys())
-        return sorted(levels)
+        return sorted(level for level in self._topic_lists if level is not None)
 
     def get_topic_list(self, level: Optional[int] = None) -> List[Dict[str, Any]]:
-        topics = []
-        for node, data in self.graph.nodes(data=True):
-            if 'levels' in data:
-                # If level is None, include all; else, only include if this node has a community at that level
-                if level is None or level in data['levels']:
-                    topics.append({
-                        'id': node,
-                        'community': data['levels'].get(level),
-                        'keywords': data.get('keywords', []),
-                        'size': self.graph.degree(node),
-                        'levels': data['levels']
-                    })
-        return topics
+        """Topics with a community at ``level`` (all topics if None), sorted by id."""
+        return list(self._topic_lists.get(level, []))
 
-    def get_topic_details(self, topic_id: str, level: int = None) -> Dict[str, Any]:
+    @_memoized
+    def get_topic_details(self, topic_id: str, level: int = None, n_documents: int = 5) -> Dict[str, Any]:
         data = self.graph.nodes[topic_id]
         subtopics = []
-        if 'subtopics' in data and level is not None:
+        if self.hierarchy is not None and level is not None:
+            if level + 1 < len(self.hierarchy['blocks']):
+                subtopics = self._co_members(topic_id, level)
+        elif 'subtopics' in data and level is not None:
             subtopics = data['subtopics'].get(level + 1, [])
+        ranked = self._ranked_documents(topic_id, level)
+        if ranked is None:
+            documents = data.get('documents', [])
+            document_count = len(documents)
+        else:
+            documents = [self.corpus[doc_id] for doc_id in ranked[:n_documents].tolist()]
+            document_count = len(ranked)
         return {
             'id': topic_id,
             'keywords': data.get('keywords', []),
-            'documents': data.get('documents', []),
+            'documents': documents,
+            'document_count': document_count,
             'subtopics': subtopics,
             'levels': data.get('levels', {}),
             'level': level
         }
 
+    @_memoized
     def get_subtopics(self, topic_id: str, level: int = None) -> List[str]:
         data = self.graph.nodes[topic_id]
+        if self.hierarchy is not None and level is not None:
+            return self._co_members(topic_id, level - 1) if level < len(self.hierarchy['blocks']) else []
         if 'subtopics' in data and level is not None:
             return data['subtopics'].get(level, [])
         return []
 
-    def get_document_snippets(self, topic_id: str, n: int = 5) -> List[str]:
-        """Return up to n document snippets for a topic."""
+    @_memoized
+    def get_document_snippets(self, topic_id: str, n: int = 5, level: int = None) -> List[str]:
+        """Return up to n document snippets for a topic, most representative first when indexed."""
+        ranked = self._ranked_documents(topic_id, level)
+        if ranked is not None:
+            return [self.corpus[doc_id] for doc_id in ranked[:n].tolist()]
         docs = self.graph.nodes[topic_id].get('documents', [])
         return docs[:n]
 
+class TopicStore:
+    """Columnar topic graph written by the pipeline's ``export_topic_store``, opened lazily.
+
+    Each column is a ``.npy`` file memory-mapped on first access, so opening the store reads only
+    ``meta.json`` and worker processes share the pages through the OS cache.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        self.n_nodes = self.meta["n_nodes"]
+        self.levels = self.meta["levels"]
+        self.level_rows = {level: row for row, level in enumerate(self.levels)}
+        self._columns = {}
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        column = self._columns.get(name)
+        if column is None:
+            column = self._columns[name] = np.load(os.path.join(self.path, f"{name}.npy"), mmap_mode="r")
+        return column
+
+    def string(self, idx: int) -> str:
+        offsets = self["string_offsets"]
+        return self["strings"][offsets[idx]:offsets[idx + 1]].tobytes().decode("utf-8")
+
+    def node_id(self, name: str) -> Optional[int]:
+        """Binary search of the sorted node names; None if ``name`` is not a node."""
+        lo, hi = 0, self.n_nodes
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.string(mid) < name:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.n_nodes and self.string(lo) == name else None
+
+    def keywords(self, node: int) -> List[str]:
+        indptr = self["keyword_indptr"]
+        return [self.string(idx) for idx in self["keyword_ids"][indptr[node]:indptr[node + 1]].tolist()]
+
+    def node_levels(self, node: int) -> Dict[int, int]:
+        blocks = self["blocks"]
+        return {level: int(blocks[row, node]) for level, row in self.level_rows.items() if blocks[row, node] >= 0}
+
+    def postings(self, level: int) -> Optional[Dict[str, np.ndarray]]:
+        if level not in self.meta["document_levels"]:
+            return None
+        return {name: self[f"L{level}_{name}"] for name in ("topic_ids", "indptr", "doc_ids")}
+
+
+class TopicStoreModel(TopicModel):
+    """TopicModel over a TopicStore directory instead of a pickled networkx graph.
+
+    To keep startup lazy, per-level topic lists and community groupings are built on first use of
+    each level rather than at load time; afterwards queries cost the same as with TopicModel.
+    """
+
+    def __init__(self, store_path: str, index_path: Optional[str] = None, corpus_path: Optional[str] = None):
+        self.store = TopicStore(store_path)
+        self.graph = None
+        self.hierarchy = None
+        self.index = load_topic_index(index_path) if index_path else None
+        corpus_path = corpus_path or self.store.meta.get("corpus_path")
+        self.corpus = CorpusLines(corpus_path) if corpus_path and os.path.exists(corpus_path) else None
+        self._topic_lists = {}
+        self._groups = {}
+        self._memo = {}
+
+    def _node(self, topic_id: str) -> int:
+        node = self.store.node_id(topic_id)
+        if node is None:
+            raise KeyError(topic_id)
+        return node
+
+    def _level_groups(self, level: int):
+        """Node ids grouped by community at ``level`` (CSR: ``indptr`` over communities, ``members``)."""
+        groups = self._groups.get(level)
+        if groups is None:
+            blocks = np.asarray(self.store["blocks"][self.store.level_rows[level]])
+            assigned = np.flatnonzero(blocks >= 0)
+            order = np.argsort(blocks[assigned], kind="stable")
+            counts = np.bincount(blocks[assigned], minlength=int(blocks.max(initial=-1)) + 1)
+            groups = self._groups[level] = (np.concatenate([[0], np.cumsum(counts)]), assigned[order])
+        return groups
+
+    def _co_members(self, topic_id: str, level: int) -> List[str]:
+        row = self.store.level_rows.get(level)
+        if row is None:
+            return []
+        node = self._node(topic_id)
+        comm = int(self.store["blocks"][row, node])
+        if comm < 0:
+            return []
+        indptr, members = self._level_groups(level)
+        return [self.store.string(member) for member in members[indptr[comm]:indptr[comm + 1]].tolist() if member != node]
+
+    def _ranked_documents(self, topic_id: str, level: Optional[int]) -> Optional[np.ndarray]:
+        row = self.store.level_rows.get(level)
+        if self.corpus is None or row is None:
+            return None
+        comm = int(self.store["blocks"][row, self._node(topic_id)])
+        postings = self.index.get(level) if self.index is not None else self.store.postings(level)
+        return _posting_documents(postings, comm if comm >= 0 else None)
+
+    def _community_terms(self, level: int) -> Dict[int, List[tuple]]:
+        if level not in self.store.level_rows:
+            return {}
+        indptr, members = self._level_groups(level)
+        degree = self.store["degree"]
+        return {
+            comm: [(self.store.string(member), int(degree[member])) for member in members[indptr[comm]:indptr[comm + 1]].tolist()]
+            for comm in np.flatnonzero(np.diff(indptr)).tolist()
+        }
+
+    def _community_edges(self, level: int):
+        row = self.store.level_rows.get(level)
+        if row is None:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float64)
+        blocks = np.asarray(self.store["blocks"][row])
+        src, dst = blocks[self.store["edge_src"]], blocks[self.store["edge_dst"]]
+        assigned = (src >= 0) & (dst >= 0)
+        return src[assigned], dst[assigned], np.asarray(self.store["edge_weight"])[assigned]
+
+    def get_levels(self) -> List[int]:
+        return list(self.store.levels)
+
+    def get_topic_list(self, level: Optional[int] = None) -> List[Dict[str, Any]]:
+        if level not in self._topic_lists:
+            self._topic_lists[level] = self._list_topics(level)
+        return list(self._topic_lists[level])
+
+    def _list_topics(self, level: Optional[int]) -> List[Dict[str, Any]]:
+        blocks, degree = self.store["blocks"], self.store["degree"]
+        if level is None:
+            nodes = np.flatnonzero((blocks >= 0).any(axis=0))
+        elif level in self.store.level_rows:
+            nodes = np.flatnonzero(blocks[self.store.level_rows[level]] >= 0)
+        else:
+            nodes = np.empty(0, dtype=np.int64)
+        topics = []
+        for node in nodes.tolist():
+            levels = self.store.node_levels(node)
+            topics.append({
+                'id': self.store.string(node),
+                'community': levels.get(level),
+                'keywords': self.store.keywords(node),
+                'size': int(degree[node]),
+                'levels': levels
+            })
+        return topics
+
+    @_memoized
+    def get_topic_details(self, topic_id: str, level: int = None, n_documents: int = 5) -> Dict[str, Any]:
+        node = self._node(topic_id)
+        subtopics = []
+        if level is not None and level + 1 < len(self.store.levels):
+            subtopics = self._co_members(topic_id, level)
+        ranked = self._ranked_documents(topic_id, level)
+        if ranked is None:
+            ranked = np.empty(0, dtype=np.int64)
+        return {
+            'id': topic_id,
+            'keywords': self.store.keywords(node),
+            'documents': [self.corpus[doc_id] for doc_id in ranked[:n_documents].tolist()],
+            'document_count': len(ranked),
+            'subtopics': subtopics,
+            'levels': self.store.node_levels(node),
+            'level': level
+        }
+
+    @_memoized
+    def get_subtopics(self, topic_id: str, level: int = None) -> List[str]:
+        if level is None or level >= len(self.store.levels):
+            return []
+        return self._co_members(topic_id, level - 1)
+
+    @_memoized
+    def get_document_snippets(self, topic_id: str, n: int = 5, level: int = None) -> List[str]:
+        ranked = self._ranked_documents(topic_id, level)
+        return [] if ranked is None else [self.corpus[doc_id] for doc_id in ranked[:n].tolist()]
+
+
+def open_topic_model(path: str, **kwargs) -> TopicModel:
+    """TopicStoreModel for a topic store directory, TopicModel for a pickled graph."""
+    if os.path.isdir(path):
+        return TopicStoreModel(path, **kwargs)
+    return TopicModel(path, **kwargs)
+
 # Example usage (not for Dash, just for testing)
-# model = TopicModel('data/topic_graph.gpickle')
+# model = open_topic_model('data/topic_store')
 # print(model.get_topic_list(level=0))
\ No newline at end of file
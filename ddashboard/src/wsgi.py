@@ -0,0 +1,11 @@
+# src/wsgi.py
+#
+# Production entry point. Run from ddashboard/src with:
+#
+#     gunicorn -c gunicorn.conf.py wsgi:server
+#
+# gunicorn.conf.py preloads this module, so the topic model is loaded once in the master and
+# shared copy-on-write by the forked workers (a topic_store directory is memory-mapped, so its
+# pages are shared through the OS cache as well).
+
+from app import app, server  # noqa: F401
@@ -0,0 +1,62 @@
+"""Compare community detection methods on the co-occurrence graph of a corpus.
+
+Builds the graph once (or loads a pickled one with ``--graph``), then runs every method of
+CooccurrenceCommunityDetector on a copy and reports runtime, number of communities and weighted
+modularity (always measured with the ``weight`` attribute, so methods are comparable):
+
+    python bench_communities.py ../data/corpus.txt --methods greedy louvain label_propagation
+"""
+import argparse
+import pickle
+import time
+
+import networkx as nx
+from networkx.algorithms.community import modularity
+
+from cooccurrence import CooccurrenceCommunityDetector, CooccurrenceGraphBuilder
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus", nargs="?", default="../data/corpus.txt")
+    parser.add_argument("--graph", help="Pickled networkx graph to use instead of building one from the corpus")
+    parser.add_argument("--min-freq", type=int, default=5)
+    parser.add_argument("--methods", nargs="+", default=list(CooccurrenceCommunityDetector.METHODS),
+                        choices=CooccurrenceCommunityDetector.METHODS)
+    parser.add_argument("--weight", default="weight", help="Edge attribute to weight by ('none' for unweighted)")
+    parser.add_argument("--resolution", type=float, default=1.0)
+    parser.add_argument("--repeats", type=int, default=1, help="Runs per method; the fastest is reported")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    weight = None if args.weight.lower() == "none" else args.weight
+
+    if args.graph:
+        with open(args.graph, "rb") as f:
+            graph = pickle.load(f)
+    else:
+        start = time.perf_counter()
+        graph = CooccurrenceGraphBuilder().build_from_documents(args.corpus, min_freq=args.min_freq, engine="sparse")
+        print(f"Built graph in {time.perf_counter() - start:.1f}s")
+    print(f"{graph.number_of_nodes()} nodes, {graph.number_of_edges()} edges; weight={weight}, "
+          f"resolution={args.resolution}\n")
+
+    print(f"{'method':<20}{'seconds':>10}{'communities':>13}{'modularity':>12}")
+    for method in args.methods:
+        timings = []
+        for _ in range(args.repeats):
+            detector = CooccurrenceCommunityDetector(nx.Graph(graph))
+            start = time.perf_counter()
+            try:
+                detector.detect(method=method, weight=weight, resolution=args.resolution, seed=args.seed)
+            except ImportError as e:
+                print(f"{method:<20}skipped: {e}")
+                break
+            timings.append(time.perf_counter() - start)
+        if not timings:
+            continue
+        score = modularity(graph, detector.communities, weight="weight")
+        print(f"{method:<20}{min(timings):>10.3f}{len(detector.communities):>13}{score:>12.4f}")
+
+
+if __name__ == "__main__":
+    main()
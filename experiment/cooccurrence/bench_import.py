@@ -0,0 +1,68 @@
+"""Measure the cold-start cost of importing a module, e.g. ``cooccurrence``.
+
+Each run imports the module in a fresh interpreter with ``-X importtime`` and reports the wall
+time plus the slowest imports of the last run. Heavy dependencies showing up here mean something
+is imported at module level again; ``--max-seconds`` turns the benchmark into a check:
+
+    python bench_import.py --runs 5 --max-seconds 1.5
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def time_import(module: str):
+    """Import ``module`` in a fresh interpreter; return wall seconds and ``-X importtime`` rows."""
+    start = time.perf_counter()
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+        capture_output=True,
+        text=True,
+    )
+    elapsed = time.perf_counter() - start
+    if result.returncode != 0:
+        raise RuntimeError(f"import {module} failed:\n{result.stderr}")
+    rows = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        # One space after the separator, then two more per level of nesting
+        rows.append((int(cumulative_us), int(self_us), name.rstrip()[1:]))
+    return elapsed, rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("module", nargs="?", default="cooccurrence")
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--top", type=int, default=15, help="Number of slowest top-level imports to list")
+    parser.add_argument("--max-seconds", type=float, default=None,
+                        help="Exit with status 1 if the median import time exceeds this")
+    args = parser.parse_args()
+
+    timings = []
+    for _ in range(args.runs):
+        elapsed, rows = time_import(args.module)
+        timings.append(elapsed)
+    median = statistics.median(timings)
+    print(f"import {args.module}: median {median:.3f}s, min {min(timings):.3f}s, "
+          f"max {max(timings):.3f}s over {args.runs} runs (includes interpreter startup)")
+
+    # The module and its direct imports (deeper imports are indented further in -X importtime output)
+    print(f"\n{'cumulative ms':>14}{'self ms':>10}  package")
+    shallow = [(cumulative, own, name.strip()) for cumulative, own, name in rows if not name.startswith("    ")]
+    for cumulative_us, self_us, name in sorted(shallow, reverse=True)[:args.top]:
+        print(f"{cumulative_us / 1000:>14.1f}{self_us / 1000:>10.1f}  {name}")
+
+    if args.max_seconds is not None and median > args.max_seconds:
+        print(f"\nFAIL: median import time {median:.3f}s exceeds {args.max_seconds:.3f}s")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
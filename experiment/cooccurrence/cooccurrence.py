@@ -1,39 +1,312 @@
-import nltk
-import matplotlib.pyplot as plt
 import networkx as nx
-import spacy
-from spacy.cli import download
-from typing import List, Dict
-from collections import Counter, defaultdict
-import math
+from typing import List, Dict, Iterable, Iterator, Optional, Tuple, Union
+from collections import Counter, defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
 import re
+import os
+import json
+import pickle
+import hashlib
+import numpy as np
+from scipy import sparse
 from collections import Counter
-import graph_tool.all as gt
-from pyvis.network import Network
-from graph_tool.all import draw_hierarchy, NestedBlockState
-import plotly.graph_objects as go
-import openai  # Only if using LLM method
-
-# Download NLTK corpora as needed
-for resource in ["stopwords", "punkt"]:
+from itertools import islice
+import sys
+from token_cache import TokenCache
+from gt_conversion import to_graph_tool
+from document_store import DocumentStore
+from labeling import CommunityLabeler
+from null_model import benjamini_hochberg, permutation_pvalues, window_pairs
+
+# Heavy dependencies (spaCy, NLTK, graph-tool, matplotlib, plotly, pyvis, openai) are imported inside
+# the functions that use them, and nothing is downloaded implicitly: run `python cooccurrence.py setup`
+# once on a networked host to fetch the resources below.
+
+SPACY_MODEL = "en_core_web_sm"
+NLTK_RESOURCES = {"stopwords": "corpora/stopwords", "punkt": "tokenizers/punkt"}
+
+# Only pos_ and lemma_ are consumed by the builder, so these components are never loaded
+UNUSED_PIPES = ["ner", "parser"]
+
+_nlp = None
+
+
+def get_nlp():
+    """The spaCy pipeline, loaded on first use without the components listed in UNUSED_PIPES."""
+    global _nlp
+    if _nlp is None:
+        import spacy
+        try:
+            _nlp = spacy.load(SPACY_MODEL, exclude=UNUSED_PIPES)
+        except OSError as e:
+            raise RuntimeError(
+                f"spaCy model '{SPACY_MODEL}' is not installed; run `python cooccurrence.py setup`"
+            ) from e
+    return _nlp
+
+
+def english_stopwords() -> List[str]:
+    import nltk
     try:
-        nltk.data.find(f"corpora/{resource}" if resource == "stopwords" else f"tokenizers/{resource}")
-    except LookupError:
-        nltk.download(resource)
+        return nltk.corpus.stopwords.words("english")
+    except LookupError as e:
+        raise RuntimeError("NLTK stopwords are not installed; run `python cooccurrence.py setup`") from e
+
 
-# Load or download spaCy model
-try:
-    nlp = spacy.load("en_core_web_sm")
-except OSError:
-    download("en_core_web_sm")
-    nlp = spacy.load("en_core_web_sm")
+def setup_resources():
+    """Download the NLTK corpora and spaCy model used by this module, skipping those already present."""
+    import nltk
+    import spacy
+    from spacy.cli import download
+
+    for resource, path in NLTK_RESOURCES.items():
+        try:
+            nltk.data.find(path)
+        except LookupError:
+            nltk.download(resource)
+    if not spacy.util.is_package(SPACY_MODEL):
+        download(SPACY_MODEL)
+
+# Number of documents looked up in the token cache per round trip
+CACHE_LOOKUP_CHUNK = 10000
+
+
+def iter_corpus(path: str) -> Iterator[str]:
+    """Lazily yield the documents of a one-document-per-line corpus file such as corpus.txt.
+
+    Lines end at ``\n`` only (no universal newlines), so a stray ``\r`` inside a document neither
+    splits it nor is translated, and document ids match those of DocumentStore.
+    """
+    with open(path, "r", encoding="utf-8", newline="\n") as f:
+        yield from f
+
+
+class CooccurrenceCounts:
+    """Window co-occurrence counts over integer token ids, accumulated into a sparse matrix.
+
+    Documents are buffered and counted together: window pairs are emitted with NumPy over the
+    concatenated id stream and folded into a ``vocab x vocab`` CSR matrix. Pairs live in the upper
+    triangle (``row <= col``); a word repeated inside a window lands on the diagonal, matching
+    the ``(w, w)`` keys of the dict engine.
+
+    ``keep_streams=True`` also keeps the encoded token streams (int32 ids plus document lengths),
+    which the permutation null model shuffles.
+    """
+
+    def __init__(self, window_size: int = 10, flush_tokens: int = 500_000, keep_doc_term: bool = False,
+                 keep_streams: bool = False):
+        self.window_size = window_size
+        self.flush_tokens = flush_tokens
+        self.keep_doc_term = keep_doc_term
+        self.keep_streams = keep_streams
+        self.vocab: Dict[str, int] = {}
+        self.words: List[str] = []
+        self.word_counts = np.zeros(0, dtype=np.int64)
+        self.doc_freq = np.zeros(0, dtype=np.int64)
+        self.total_docs = 0
+        self._pairs = sparse.csr_matrix((0, 0), dtype=np.int64)
+        self._pending: List[np.ndarray] = []
+        self._pending_tokens = 0
+        self._doc_term_chunks = []
+        self._stream_chunks = []
+
+    @classmethod
+    def from_dicts(cls, word_counts: Dict[str, int], doc_freq: Dict[str, int],
+                   pair_counts: Dict[tuple, int], total_docs: int, window_size: int = 10) -> "CooccurrenceCounts":
+        """Wrap counts produced by the dict engine so both engines share the same validation step."""
+        counts = cls(window_size=window_size)
+        counts.words = list(word_counts)
+        counts.vocab = {word: idx for idx, word in enumerate(counts.words)}
+        size = len(counts.words)
+        counts.word_counts = np.fromiter(word_counts.values(), dtype=np.int64, count=size)
+        counts.doc_freq = np.fromiter((doc_freq.get(word, 0) for word in counts.words), dtype=np.int64, count=size)
+        first = np.fromiter((counts.vocab[w1] for w1, _ in pair_counts), dtype=np.int64, count=len(pair_counts))
+        second = np.fromiter((counts.vocab[w2] for _, w2 in pair_counts), dtype=np.int64, count=len(pair_counts))
+        values = np.fromiter(pair_counts.values(), dtype=np.int64, count=len(pair_counts))
+        counts._pairs = sparse.csr_matrix(
+            (values, (np.minimum(first, second), np.maximum(first, second))), shape=(size, size)
+        )
+        counts.total_docs = total_docs
+        return counts
+
+    def _encode(self, words: List[str]) -> np.ndarray:
+        vocab = self.vocab
+        for word in words:
+            if word not in vocab:
+                vocab[word] = len(self.words)
+                self.words.append(word)
+        return np.fromiter((vocab[word] for word in words), dtype=np.int64, count=len(words))
+
+    def add_document(self, words: List[str]):
+        self.total_docs += 1
+        ids = self._encode(words)
+        self._pending.append(ids)
+        self._pending_tokens += len(ids)
+        if self._pending_tokens >= self.flush_tokens:
+            self.flush()
+
+    def add_documents(self, token_lists: Iterable[List[str]]):
+        for words in token_lists:
+            self.add_document(words)
+        self.flush()
+
+    def flush(self):
+        """Count the buffered documents and merge them into the running totals."""
+        if not self._pending:
+            return
+        size = len(self.words)
+        lengths = np.fromiter((len(ids) for ids in self._pending), dtype=np.int64, count=len(self._pending))
+        ids = np.concatenate(self._pending)
+        doc_index = np.repeat(np.arange(len(lengths)), lengths)
+        first_doc = self.total_docs - len(lengths)
+        self._pending = []
+        self._pending_tokens = 0
+
+        self.word_counts = np.pad(self.word_counts, (0, size - len(self.word_counts)))
+        self.doc_freq = np.pad(self.doc_freq, (0, size - len(self.doc_freq)))
+        self.word_counts += np.bincount(ids, minlength=size)
+
+        # Only documents that produce at least one pair count towards document frequency
+        paired = (lengths > 1)[doc_index] if self.window_size > 1 else np.zeros(len(ids), dtype=bool)
+        doc_terms = np.unique(doc_index[paired] * size + ids[paired])
+        self.doc_freq += np.bincount(doc_terms % size, minlength=size)
+
+        if self.keep_doc_term:
+            doc_terms, term_counts = np.unique(doc_index * size + ids, return_counts=True)
+            self._doc_term_chunks.append((first_doc + doc_terms // size, doc_terms % size, term_counts))
+        if self.keep_streams:
+            self._stream_chunks.append((ids.astype(np.int32), lengths))
+
+        rows, cols = window_pairs(ids, doc_index, self.window_size)
+        self._pairs.resize((size, size))
+        if len(rows):
+            chunk = sparse.coo_matrix((np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(size, size))
+            self._pairs = self._pairs + chunk.tocsr()
+
+    @property
+    def pair_counts(self) -> sparse.csr_matrix:
+        self.flush()
+        return self._pairs
+
+    def doc_term_matrix(self) -> sparse.csr_matrix:
+        """Sparse ``documents x vocab`` term counts; requires ``keep_doc_term=True``."""
+        if not self.keep_doc_term:
+            raise ValueError("Document-term counts were not kept; pass keep_doc_term=True")
+        self.flush()
+        shape = (self.total_docs, len(self.words))
+        if not self._doc_term_chunks:
+            return sparse.csr_matrix(shape, dtype=np.int64)
+        rows, cols, data = (np.concatenate(parts) for parts in zip(*self._doc_term_chunks))
+        return sparse.csr_matrix((data, (rows, cols)), shape=shape)
+
+    def token_streams(self) -> Tuple[np.ndarray, np.ndarray]:
+        """Concatenated token ids of every document and the document lengths; requires ``keep_streams=True``."""
+        if not self.keep_streams:
+            raise ValueError("Token streams were not kept; pass keep_streams=True")
+        self.flush()
+        if not self._stream_chunks:
+            return np.zeros(0, dtype=np.int32), np.zeros(0, dtype=np.int64)
+        ids, lengths = zip(*self._stream_chunks)
+        return np.concatenate(ids), np.concatenate(lengths)
+
+    def pair_table(self):
+        """Return ``(rows, cols, counts)`` arrays of every observed pair."""
+        pairs = self.pair_counts.tocoo()
+        return pairs.row.astype(np.int64), pairs.col.astype(np.int64), pairs.data
+
+    def merge(self, other: "CooccurrenceCounts"):
+        """Add another table's counts into this one, remapping its vocabulary ids onto ours.
+
+        Ids of words already in this table are unchanged, so arrays indexed by them stay valid.
+        """
+        self.flush()
+        other.flush()
+        remap = self._encode(other.words)
+        size = len(self.words)
+        self.word_counts = np.pad(self.word_counts, (0, size - len(self.word_counts)))
+        self.doc_freq = np.pad(self.doc_freq, (0, size - len(self.doc_freq)))
+        self.word_counts[remap] += other.word_counts
+        self.doc_freq[remap] += other.doc_freq
+
+        rows, cols, values = other.pair_table()
+        rows, cols = remap[rows], remap[cols]
+        self._pairs.resize((size, size))
+        self._pairs = self._pairs + sparse.csr_matrix(
+            (values, (np.minimum(rows, cols), np.maximum(rows, cols))), shape=(size, size)
+        )
+        if self.keep_doc_term:
+            for docs, terms, term_counts in other._doc_term_chunks:
+                self._doc_term_chunks.append((docs + self.total_docs, remap[terms], term_counts))
+        if self.keep_streams:
+            for ids, lengths in other._stream_chunks:
+                self._stream_chunks.append((remap[ids].astype(np.int32), lengths))
+        self.total_docs += other.total_docs
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Sufficient statistics as plain arrays, suitable for ``np.savez``; includes kept token streams."""
+        rows, cols, values = self.pair_table()
+        arrays = {
+            "words": np.array(self.words, dtype=str),
+            "word_counts": self.word_counts,
+            "doc_freq": self.doc_freq,
+            "pair_rows": rows,
+            "pair_cols": cols,
+            "pair_counts": values,
+            "total_docs": np.int64(self.total_docs),
+            "window_size": np.int64(self.window_size),
+        }
+        if self.keep_streams:
+            arrays["stream_ids"], arrays["stream_lengths"] = self.token_streams()
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "CooccurrenceCounts":
+        counts = cls(window_size=int(arrays["window_size"]), keep_streams="stream_ids" in arrays)
+        if counts.keep_streams:
+            counts._stream_chunks = [(np.asarray(arrays["stream_ids"], dtype=np.int32),
+                                      np.asarray(arrays["stream_lengths"], dtype=np.int64))]
+        counts.words = [str(word) for word in arrays["words"]]
+        counts.vocab = {word: idx for idx, word in enumerate(counts.words)}
+        size = len(counts.words)
+        counts.word_counts = np.asarray(arrays["word_counts"], dtype=np.int64)
+        counts.doc_freq = np.asarray(arrays["doc_freq"], dtype=np.int64)
+        counts._pairs = sparse.csr_matrix(
+            (arrays["pair_counts"], (arrays["pair_rows"], arrays["pair_cols"])), shape=(size, size), dtype=np.int64
+        )
+        counts.total_docs = int(arrays["total_docs"])
+        return counts
+
+
+def _count_shard(documents: List[str], preprocess_config: Dict, token_cache: "TokenCache",
+                 window_size: int, keep_doc_term: bool, batch_size: int, keep_streams: bool = False) -> CooccurrenceCounts:
+    """Map step of the sharded build: preprocess and count one shard in a worker process."""
+    builder = CooccurrenceGraphBuilder(token_cache=token_cache)
+    for name, value in preprocess_config.items():
+        setattr(builder, name, value)
+    counts = CooccurrenceCounts(window_size=window_size, keep_doc_term=keep_doc_term, keep_streams=keep_streams)
+    try:
+        counts.add_documents(builder.preprocess_batch(documents, batch_size=batch_size))
+    finally:
+        # Each shard unpickles its own cache connection; close it rather than leak a descriptor per shard
+        if token_cache is not None:
+            token_cache.close()
+    return counts
 
 
 # Word Co-occurrence Graph Module with Statistical Validation
 class CooccurrenceGraphBuilder:
-    def __init__(self):
+    def __init__(self, token_cache: TokenCache = None):
         self.graph = nx.Graph()
-        self.stop_words = set(nltk.corpus.stopwords.words("english"))
+        self.token_cache = token_cache
+        self._fingerprint = (None, None)  # (frozen copy of the config, fingerprint), see config_fingerprint
+        self.pos_tags = {"NOUN", "ADJ"}
+        self.vocab: Dict[str, int] = {}
+        self.doc_term = None  # documents x vocab counts, kept by the sparse engine on request
+        self.counts = None  # CooccurrenceCounts behind the most recent build
+        self.min_freq = None
+        self.significance = {"method": "zscore"}  # Edge test and its options, set by build_from_documents
+        self.significance_report = None
+        self.stop_words = set(english_stopwords())
         self.custom_exclude = {
             "also", "however", "therefore", "thus", "meanwhile", "usually",
             "directly", "indirectly", "essentially", "generally", "typically",
@@ -41,68 +314,303 @@ class CooccurrenceGraphBuilder:
             "mainly", "somewhat", "slightly", "significantly", "specifically"
         }
 
-    def preprocess(self, text: str) -> List[str]:
-        doc = nlp(text)
+    def _filter_tokens(self, doc) -> List[str]:
         tokens = []
         for token in doc:
             if (
                 token.is_alpha
                 and len(token.text) > 2
-                and token.pos_ in {"NOUN", "ADJ"}
+                and token.pos_ in self.pos_tags
                 and token.lemma_.lower() not in self.stop_words
                 and token.lemma_.lower() not in self.custom_exclude
             ):
                 tokens.append(token.lemma_.lower())
         return tokens
 
-    def build_from_documents(self, documents: List[str], window_size: int = 10, min_freq: int = 5):
-        word_counts = Counter()
-        cooccur_counts = defaultdict(int)
-        doc_freq = defaultdict(set)
-
-        for doc_id, doc in enumerate(documents):
-            words = self.preprocess(doc)
-            word_counts.update(words)
-            for i in range(len(words)):
-                for j in range(i + 1, min(i + window_size, len(words))):
-                    w1, w2 = sorted((words[i], words[j]))
-                    cooccur_counts[(w1, w2)] += 1
-                    doc_freq[w1].add(doc_id)
-                    doc_freq[w2].add(doc_id)
-
-        total_docs = len(documents)
-        for (w1, w2), count in cooccur_counts.items():
-            # Compute statistical threshold (p-value approximation via z-score)
-            p1 = len(doc_freq[w1]) / total_docs
-            p2 = len(doc_freq[w2]) / total_docs
-            expected = p1 * p2 * total_docs
-            if expected == 0:
-                continue
-            z_score = (count - expected) / math.sqrt(expected)
-            if z_score > 2:  # Roughly p < 0.05
-                self.graph.add_edge(w1, w2, weight=count, z=z_score)
-
-        # Prune rare nodes
-        for word in list(self.graph.nodes):
-            if word_counts[word] < min_freq:
-                self.graph.remove_node(word)
+    def config_fingerprint(self) -> str:
+        """Hash of everything that affects the output of ``preprocess``; part of every token cache key.
+
+        The hash is reused while the config compares equal, by content, to the frozen copy it was
+        computed from; comparing sets is much cheaper than sorting, serializing and hashing them.
+        """
+        config = (SPACY_MODEL, self.stop_words, self.custom_exclude, self.pos_tags)
+        if self._fingerprint[0] != config:
+            frozen = (SPACY_MODEL, frozenset(self.stop_words), frozenset(self.custom_exclude), frozenset(self.pos_tags))
+            fingerprint = TokenCache.config_fingerprint(
+                model=SPACY_MODEL,
+                stop_words=frozen[1],
+                custom_exclude=frozen[2],
+                pos_tags=frozen[3],
+            )
+            self._fingerprint = (frozen, fingerprint)
+        return self._fingerprint[1]
+
+    def preprocess(self, text: str) -> List[str]:
+        if self.token_cache is None:
+            return self._filter_tokens(get_nlp()(text))
+        key = TokenCache.document_key(text, self.config_fingerprint())
+        tokens = self.token_cache.get(key)
+        if tokens is None:
+            tokens = self._filter_tokens(get_nlp()(text))
+            self.token_cache.put(key, tokens)  # buffered; committed every token_cache.commit_every documents
+        return tokens
+
+    def preprocess_batch(self, texts: Iterable[str], batch_size: int = 256, n_process: int = 1) -> Iterator[List[str]]:
+        """Stream token lists for ``texts`` through ``nlp.pipe``, in input order.
+
+        NER and the dependency parser are not loaded since only ``pos_`` and ``lemma_`` are used.
+        ``n_process > 1`` fans the pipeline out over worker processes. With a token cache,
+        only documents missing from the cache are sent through spaCy.
+        """
+        if self.token_cache is None:
+            for doc in get_nlp().pipe(texts, batch_size=batch_size, n_process=n_process):
+                yield self._filter_tokens(doc)
+            return
+
+        fingerprint = self.config_fingerprint()
+        texts = iter(texts)
+        while True:
+            chunk = list(islice(texts, CACHE_LOOKUP_CHUNK))
+            if not chunk:
+                break
+            keys = [TokenCache.document_key(text, fingerprint) for text in chunk]
+            cached = self.token_cache.get_many(keys)
+            missing = {key: text for key, text in zip(keys, chunk) if key not in cached}
+            if missing:
+                docs = get_nlp().pipe(missing.values(), batch_size=batch_size, n_process=n_process)
+                parsed = {key: self._filter_tokens(doc) for key, doc in zip(missing, docs)}
+                self.token_cache.put_many(parsed)
+                cached.update(parsed)
+            for key in keys:
+                yield cached[key]
+
+    def _permutation_significant(self, counts: CooccurrenceCounts, rows: np.ndarray, cols: np.ndarray,
+                                 values: np.ndarray, tested: np.ndarray) -> np.ndarray:
+        """Mask of pairs whose counts exceed the within-document shuffle null at the configured FDR."""
+        if not counts.keep_streams:
+            raise ValueError("significance='permutation' needs token streams; rebuild with engine='sparse'")
+        options = self.significance
+        ids, lengths = counts.token_streams()
+        pvalues = permutation_pvalues(
+            ids, lengths, rows[tested], cols[tested], values[tested], len(counts.words), counts.window_size,
+            n_replicates=options["n_replicates"], n_workers=options["n_workers"], seed=options["seed"],
+            chunk_tokens=counts.flush_tokens, tail_approximation=options["tail_approximation"],
+        )
+        qvalues = benjamini_hochberg(pvalues)
+        significant = np.zeros(len(rows), dtype=bool)
+        significant[tested] = qvalues <= options["fdr"]
+        self.significance_report = {
+            "tested": int(tested.sum()),
+            "significant": int(significant.sum()),
+            "n_replicates": options["n_replicates"],
+            "tail_approximation": options["tail_approximation"],
+            "min_pvalue": float(pvalues.min()) if len(pvalues) else None,
+            "fdr": options["fdr"],
+        }
+        return significant
+
+    def _significant_edges(self, counts: CooccurrenceCounts, min_freq: int):
+        """Return ``(nodes, rows, cols, weights, z_scores)`` id arrays of the validated graph."""
+        rows, cols, values = counts.pair_table()
+        total_docs = counts.total_docs
+        p1 = counts.doc_freq[rows] / total_docs
+        p2 = counts.doc_freq[cols] / total_docs
+        # Statistical threshold for every pair at once (p-value approximation via z-score)
+        expected = p1 * p2 * total_docs
+        with np.errstate(divide="ignore", invalid="ignore"):
+            z_scores = (values - expected) / np.sqrt(expected)
+
+        # Rare words are masked on the vocabulary, so their pairs never reach the graph. Windows are
+        # still counted over the unfiltered token sequence, which keeps the pair counts unchanged.
+        frequent = counts.word_counts >= min_freq
+        if self.significance["method"] == "permutation":
+            # Only pairs that can become edges are tested, so rare words do not dilute the FDR
+            significant = self._permutation_significant(counts, rows, cols, values, frequent[rows] & frequent[cols])
+        else:
+            significant = (expected > 0) & (z_scores > 2)  # Roughly p < 0.05
+        keep = significant & frequent[rows] & frequent[cols]
+
+        # A frequent word whose only significant edges lead to rare words remains as an isolated node
+        nodes = np.unique(np.concatenate([rows[significant], cols[significant]]))
+        return nodes[frequent[nodes]], rows[keep], cols[keep], values[keep], z_scores[keep]
+
+    def _add_significant_edges(self, counts: CooccurrenceCounts, min_freq: int):
+        nodes, rows, cols, weights, z_scores = self._significant_edges(counts, min_freq)
+        words = counts.words
+        # Invalidates cached graph-tool conversions of this graph
+        self.graph.graph["revision"] = self.graph.graph.get("revision", 0) + 1
+        self.graph.add_nodes_from(words[idx] for idx in nodes.tolist())
+        self.graph.add_edges_from(
+            (words[i], words[j], {"weight": count, "z": z_score})
+            for i, j, count, z_score in zip(rows.tolist(), cols.tolist(), weights.tolist(), z_scores.tolist())
+        )
+
+    def _refresh_significant_edges(self, counts: CooccurrenceCounts, min_freq: int):
+        """Bring the graph in line with ``counts`` in place, keeping attributes of surviving nodes."""
+        nodes, rows, cols, weights, z_scores = self._significant_edges(counts, min_freq)
+        words = counts.words
+        node_set = {words[idx] for idx in nodes.tolist()}
+        edge_set = {frozenset((words[i], words[j])) for i, j in zip(rows.tolist(), cols.tolist())}
+        self.graph.remove_edges_from([(u, v) for u, v in self.graph.edges if frozenset((u, v)) not in edge_set])
+        self.graph.remove_nodes_from([node for node in self.graph.nodes if node not in node_set])
+        self._add_significant_edges(counts, min_freq)
+
+    def _count_sharded(self, documents: Iterable[str], window_size: int, keep_doc_term: bool, batch_size: int,
+                       n_workers: int, shard_size: int, keep_streams: bool = False) -> CooccurrenceCounts:
+        """Count shards of ``shard_size`` documents in a process pool and merge them in corpus order."""
+        preprocess_config = {
+            "stop_words": self.stop_words,
+            "custom_exclude": self.custom_exclude,
+            "pos_tags": self.pos_tags,
+        }
+        counts = CooccurrenceCounts(window_size=window_size, keep_doc_term=keep_doc_term, keep_streams=keep_streams)
+        documents = iter(documents)
+        in_flight = deque()
+        with ProcessPoolExecutor(max_workers=n_workers) as pool:
+            while True:
+                shard = list(islice(documents, shard_size))
+                if shard:
+                    in_flight.append(pool.submit(
+                        _count_shard, shard, preprocess_config, self.token_cache, window_size, keep_doc_term, batch_size,
+                        keep_streams
+                    ))
+                # Bound the number of shards held in memory; reduce as results come back
+                while in_flight and (not shard or len(in_flight) >= 2 * n_workers):
+                    counts.merge(in_flight.popleft().result())
+                if not shard:
+                    break
+        return counts
+
+    def build_from_documents(self, documents: Union[Iterable[str], str], window_size: int = 10, min_freq: int = 5,
+                             batch_size: int = 256, n_process: int = 1, engine: str = "python",
+                             keep_doc_term: bool = False, chunk_tokens: int = 500_000,
+                             n_workers: int = 1, shard_size: int = 1000, significance: str = "zscore",
+                             n_replicates: int = 200, fdr: float = 0.05, seed: int = 0,
+                             tail_approximation: bool = True):
+        """Build the validated co-occurrence graph from an iterable of documents or a corpus path.
+
+        ``engine="sparse"`` counts with NumPy/scipy.sparse (and shards over ``n_workers`` processes);
+        ``significance="permutation"`` replaces the z > 2 test with a shuffle null model at ``fdr``.
+        See "Performance Options" in the README for the remaining options.
+        """
+        if isinstance(documents, str):
+            documents = iter_corpus(documents)
+        if n_workers > 1 and engine != "sparse":
+            raise ValueError("Sharded builds (n_workers > 1) require engine='sparse'")
+        if significance not in ("zscore", "permutation"):
+            raise ValueError(f"Unknown significance test: {significance}")
+        if significance == "permutation" and engine != "sparse":
+            raise ValueError("significance='permutation' requires engine='sparse'")
+        self.significance = {"method": significance}
+        if significance == "permutation":
+            self.significance.update(n_replicates=n_replicates, fdr=fdr, seed=seed, n_workers=n_workers,
+                                     tail_approximation=tail_approximation)
+        keep_streams = significance == "permutation"
+        token_stream = self.preprocess_batch(documents, batch_size=batch_size, n_process=n_process)
+
+        if engine == "sparse" and n_workers > 1:
+            counts = self._count_sharded(documents, window_size, keep_doc_term, batch_size, n_workers, shard_size,
+                                         keep_streams)
+            if keep_doc_term:
+                self.vocab = dict(counts.vocab)
+                self.doc_term = counts.doc_term_matrix()
+        elif engine == "sparse":
+            counts = CooccurrenceCounts(window_size=window_size, flush_tokens=chunk_tokens, keep_doc_term=keep_doc_term,
+                                        keep_streams=keep_streams)
+            counts.add_documents(token_stream)
+            if keep_doc_term:
+                self.vocab = dict(counts.vocab)
+                self.doc_term = counts.doc_term_matrix()
+        elif engine == "python":
+            word_counts = Counter()
+            doc_freq = Counter()
+            cooccur_counts = defaultdict(int)
+            total_docs = 0
+            for words in token_stream:
+                total_docs += 1
+                word_counts.update(words)
+                # Once per document from its vocabulary; only documents that produce pairs count
+                if len(words) > 1:
+                    doc_freq.update(set(words))
+                for i in range(len(words)):
+                    for j in range(i + 1, min(i + window_size, len(words))):
+                        w1, w2 = sorted((words[i], words[j]))
+                        cooccur_counts[(w1, w2)] += 1
+            counts = CooccurrenceCounts.from_dicts(word_counts, doc_freq, cooccur_counts, total_docs, window_size)
+        else:
+            raise ValueError(f"Unknown counting engine: {engine}")
+
+        self.counts = counts
+        self.min_freq = min_freq
+        self._add_significant_edges(counts, min_freq)
+        return self.graph
+
+    def update(self, new_documents: Union[Iterable[str], str], batch_size: int = 256, n_process: int = 1):
+        """Add documents to an existing build without recounting the rest of the corpus.
+
+        Only the new documents are preprocessed and counted; their counts are merged into
+        ``self.counts``. Every pair's expectation depends on the total document count, so the
+        z-scores are re-evaluated over the whole pair table (a vectorized pass), and the graph is
+        edited in place: edges and nodes that lost significance are removed, the rest are added or
+        have their weight and z updated. The result matches a full rebuild over the combined corpus.
+        """
+        if self.counts is None:
+            raise ValueError("Nothing to update; call build_from_documents or load_statistics first")
+        if isinstance(new_documents, str):
+            new_documents = iter_corpus(new_documents)
+        delta = CooccurrenceCounts(window_size=self.counts.window_size, keep_doc_term=self.counts.keep_doc_term,
+                                   keep_streams=self.counts.keep_streams)
+        delta.add_documents(self.preprocess_batch(new_documents, batch_size=batch_size, n_process=n_process))
+        self.counts.merge(delta)
+        if self.counts.keep_doc_term:
+            self.vocab = dict(self.counts.vocab)
+            self.doc_term = self.counts.doc_term_matrix()
+        self._refresh_significant_edges(self.counts, self.min_freq)
+        return self.graph
+
+    def save_statistics(self, path: str):
+        """Persist word counts, document frequencies, pair counts and ``total_docs`` to an ``.npz`` file.
 
+        The significance test and its options are saved too, with the token streams the
+        permutation test needs, so a loaded build validates edges exactly like the original.
+        """
+        np.savez_compressed(path, min_freq=np.int64(self.min_freq), significance=np.str_(json.dumps(self.significance)),
+                            **self.counts.to_arrays())
+
+    def load_statistics(self, path: str):
+        """Restore statistics saved by ``save_statistics`` and rebuild the graph from them."""
+        with np.load(path) as arrays:
+            self.counts = CooccurrenceCounts.from_arrays(arrays)
+            self.min_freq = int(arrays["min_freq"])
+            # Files written before the test was recorded were always z-score builds
+            self.significance = json.loads(str(arrays["significance"])) if "significance" in arrays else {"method": "zscore"}
+        if self.significance["method"] == "permutation" and not self.counts.keep_streams:
+            raise ValueError(f"{path} has no token streams for significance='permutation'")
+        self.graph = nx.Graph()
+        self._add_significant_edges(self.counts, self.min_freq)
         return self.graph
 
 
 # Graph Visualization and Interface Module
 class GraphVisualizer:
-    def __init__(self, nx_graph: nx.Graph):
+    def __init__(self, nx_graph: nx.Graph, layout_cache: str = None):
         self.graph = nx_graph
+        # Layout positions by (node selection, edge digest, layout, seed); optionally pickled to layout_cache
+        self.layout_cache = layout_cache
+        self._positions = {}
+        if layout_cache and os.path.exists(layout_cache):
+            with open(layout_cache, "rb") as f:
+                self._positions = pickle.load(f)
 
     def draw_graph(self, with_labels=True, node_color_by_community=True):
+        import matplotlib.pyplot as plt
         pos = nx.spring_layout(self.graph, seed=42)
         communities = nx.get_node_attributes(self.graph, "community")
         colors = [communities.get(node, 0) for node in self.graph.nodes()] if node_color_by_community else "skyblue"
 
         plt.figure(figsize=(12, 8))
+        # nx.draw already draws the labels when with_labels is set
         nx.draw(self.graph, pos, with_labels=with_labels, node_color=colors, cmap=plt.cm.Set3, edge_color="gray")
-        nx.draw_networkx_labels(self.graph, pos)
 
         # Annotate community group on plot
         if node_color_by_community:
@@ -113,45 +621,319 @@ class GraphVisualizer:
         plt.title("Knowledge Graph Visualization with Communities")
         plt.show()
 
+    def top_nodes(self, top_n: int = None, rank_by: str = "degree") -> List[str]:
+        """Nodes ordered by degree (``rank_by="degree"``) or summed edge weight (``"weight"``), best first."""
+        if rank_by not in ("degree", "weight"):
+            raise ValueError(f"Unknown rank_by: {rank_by}; expected 'degree' or 'weight'")
+        ranking = self.graph.degree(weight="weight" if rank_by == "weight" else None)
+        ranked = sorted(ranking, key=lambda item: (-item[1], str(item[0])))
+        return [node for node, _ in ranked[:top_n]]
+
+    def layout(self, nodes: List[str], layout: str = "sfdp", seed: int = 42) -> Dict[str, np.ndarray]:
+        """Positions of the subgraph induced by ``nodes``, cached by the subgraph's nodes, edges and weights.
+
+        ``layout="sfdp"`` uses graph-tool's multilevel force-directed layout weighted by co-occurrence;
+        ``"spring"`` falls back to networkx (quadratic, for small graphs only).
+        """
+        subgraph = self.graph.subgraph(nodes)
+        # Hash the (small) subgraph itself, so reweighted or rewired edges never reuse old positions
+        digest = hashlib.sha256()
+        for u, v, weight in subgraph.edges(data="weight"):
+            digest.update(f"{u}\t{v}\t{weight}\n".encode("utf-8"))
+        key = (tuple(nodes), digest.hexdigest(), layout, seed)
+        if key in self._positions:
+            return self._positions[key]
+        if layout == "sfdp":
+            import graph_tool.all as gt
+            gt.seed_rng(seed)
+            gt_graph = to_graph_tool(subgraph)
+            coords = gt.sfdp_layout(gt_graph, eweight=gt_graph.ep["weight"]).get_2d_array([0, 1]).T
+            names = gt_graph.vp["name"]
+            positions = {names[v]: coords[int(v)] for v in gt_graph.vertices()}
+        elif layout == "spring":
+            positions = nx.spring_layout(subgraph, seed=seed)
+        else:
+            raise ValueError(f"Unknown layout: {layout}")
+        self._positions[key] = positions
+        if self.layout_cache:
+            with open(self.layout_cache, "wb") as f:
+                pickle.dump(self._positions, f)
+        return positions
+
+    def render(self, output_file: str = "graph.png", top_n: int = 500, rank_by: str = "degree",
+               label_top: int = 50, layout: str = "sfdp", figsize=(16, 12), dpi: int = 150):
+        """Draw the ``top_n`` highest-ranked nodes straight to ``output_file`` (PNG, SVG, PDF, ...).
+
+        Runs headless: the figure is rendered with the Agg canvas, without pyplot or a display.
+        Nodes are colored by ``community`` and sized by rank; only the ``label_top`` highest-ranked
+        nodes are labeled, so labels stay legible on large graphs.
+        """
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.collections import LineCollection
+        from matplotlib.figure import Figure
+
+        nodes = self.top_nodes(top_n, rank_by)
+        positions = self.layout(nodes, layout)
+        subgraph = self.graph.subgraph(nodes)
+        xy = np.array([positions[node] for node in nodes]).reshape(-1, 2)
+        rank = np.arange(len(nodes))
+        sizes = 10 + 190 * (1 - rank / max(len(nodes), 1))
+        communities = [self.graph.nodes[node].get("community", 0) for node in nodes]
+
+        fig = Figure(figsize=figsize)
+        FigureCanvasAgg(fig)
+        ax = fig.add_subplot()
+        segments = [(positions[u], positions[v]) for u, v in subgraph.edges()]
+        ax.add_collection(LineCollection(segments, colors="gray", linewidths=0.3, alpha=0.4, zorder=1))
+        ax.scatter(xy[:, 0], xy[:, 1], s=sizes, c=communities, cmap="tab20", zorder=2)
+        for node in nodes[:label_top]:
+            x, y = positions[node]
+            ax.annotate(str(node), (x, y), fontsize=8, ha="center", va="bottom", zorder=3)
+        ax.set_title(f"Top {len(nodes)} of {self.graph.number_of_nodes()} nodes by {rank_by}")
+        ax.set_axis_off()
+        ax.autoscale_view()
+        fig.savefig(output_file, dpi=dpi, bbox_inches="tight")
+        print(f"Graph rendered to {output_file}")
+        return output_file
+
 
 # Community Detection for Co-occurrence Graphs
 class CooccurrenceCommunityDetector:
+    METHODS = ("greedy", "louvain", "leiden", "label_propagation")
+
     def __init__(self, graph: nx.Graph):
         self.graph = graph
+        self.communities = None
 
-    def detect(self):
-        from networkx.algorithms.community import greedy_modularity_communities
-        communities = list(greedy_modularity_communities(self.graph))
-        for i, group in enumerate(communities):
+    def _leiden(self, weight: Optional[str], resolution: float, seed: Optional[int]) -> List[set]:
+        try:
+            import igraph as ig
+            import leidenalg
+        except ImportError as e:
+            raise ImportError("method='leiden' requires the optional packages leidenalg and python-igraph") from e
+        nodes = list(self.graph.nodes)
+        index = {node: i for i, node in enumerate(nodes)}
+        edges = self.graph.edges(data=weight, default=1) if weight else self.graph.edges(data=True)
+        ig_graph = ig.Graph(n=len(nodes), edges=[(index[u], index[v]) for u, v, _ in edges])
+        weights = [w for _, _, w in edges] if weight else None
+        partition = leidenalg.find_partition(
+            ig_graph, leidenalg.RBConfigurationVertexPartition, weights=weights,
+            resolution_parameter=resolution, seed=seed,
+        )
+        return [{nodes[i] for i in members} for members in partition]
+
+    def detect(self, method: str = "greedy", weight: Optional[str] = None, resolution: float = 1.0,
+               seed: Optional[int] = None):
+        """Assign a ``community`` id to every node, largest community first.
+
+        ``method`` is one of:
+
+        - ``"greedy"``: Clauset-Newman-Moore greedy modularity (the original method, slow on large graphs)
+        - ``"louvain"``: multilevel modularity optimization, near-linear in the number of edges
+        - ``"leiden"``: Louvain with connected communities guaranteed; needs ``leidenalg`` and ``python-igraph``
+        - ``"label_propagation"``: asynchronous label propagation, fastest, ignores ``resolution``
+
+        ``weight`` names the edge attribute to weight by, e.g. ``"weight"`` (co-occurrence counts)
+        or ``"z"`` (z-scores; only positive values make sense), or None for the unweighted graph.
+        Higher ``resolution`` yields more, smaller communities. ``seed`` fixes the randomized methods.
+        """
+        from networkx.algorithms import community
+        if method == "greedy":
+            communities = community.greedy_modularity_communities(self.graph, weight=weight, resolution=resolution)
+        elif method == "louvain":
+            communities = community.louvain_communities(self.graph, weight=weight, resolution=resolution, seed=seed)
+        elif method == "leiden":
+            communities = self._leiden(weight, resolution, seed)
+        elif method == "label_propagation":
+            communities = community.asyn_lpa_communities(self.graph, weight=weight, seed=seed)
+        else:
+            raise ValueError(f"Unknown community detection method: {method}; expected one of {self.METHODS}")
+        self.communities = sorted(communities, key=len, reverse=True)
+        for i, group in enumerate(self.communities):
             for node in group:
                 self.graph.nodes[node]["community"] = i
         return self.graph
 
 
+# Edge covariate models for the attributes written by CooccurrenceGraphBuilder
+DEFAULT_REC_TYPES = {"weight": "discrete-geometric", "z": "real-exponential"}
+
+
+def _fit_nested_state(graph: nx.Graph, options: Dict, seed: int):
+    """Worker for multi-start fits: seed the RNGs and fit one nested blockmodel."""
+    import graph_tool.all as gt
+    # One OpenMP thread per worker; the pool already provides the parallelism
+    gt.openmp_set_num_threads(1)
+    gt.seed_rng(seed)
+    np.random.seed(seed)
+    state = HSBMCommunityModel(graph, **options).minimize(nested=True)
+    return state.entropy(), state
+
+
 # hSBM Topic Modeling with Graph-Tool
 class HSBMCommunityModel:
-    def __init__(self, graph: nx.Graph):
+    def __init__(self, graph: nx.Graph, edge_covariate: str = None, rec_type: str = None,
+                 mcmc_niter: int = None, refine_sweeps: int = 0, refine_niter: int = 10):
+        """
+        Args:
+            graph: Co-occurrence graph; ``weight`` and ``z`` edge attributes are available as covariates.
+            edge_covariate: Edge attribute (``"weight"`` or ``"z"``) to fit a weighted SBM with; unweighted if None.
+            rec_type: graph-tool covariate model, e.g. ``"discrete-geometric"``, ``"discrete-poisson"`` or
+                ``"real-exponential"``. Defaults to ``DEFAULT_REC_TYPES[edge_covariate]``.
+            mcmc_niter: Sweeps per multilevel MCMC step inside the minimizer; graph-tool's default if None.
+            refine_sweeps: Extra zero-temperature ``multiflip_mcmc_sweep`` rounds run on the fitted state.
+            refine_niter: Sweeps per refinement round.
+        """
         self.graph = graph
+        self.edge_covariate = edge_covariate
+        self.rec_type = rec_type
+        self.mcmc_niter = mcmc_niter
+        self.refine_sweeps = refine_sweeps
+        self.refine_niter = refine_niter
+        self.state = None  # NestedBlockState, fitted once by fit()
+        self.state_fingerprint = None  # fingerprint() of the graph, options and fit arguments behind state
+        self.fit_report = None  # Description-length spread of the last multi-start fit
+        self._block_levels = None
+        self._converted_fingerprint = None  # fingerprint() of the graph at its last conversion
+
+    def convert_to_graphtool(self, refresh: bool = False):
+        """Cached graph-tool copy of the graph, converted again whenever ``fingerprint()`` changed.
+
+        The shared conversion cache only tracks revision and node/edge counts, which miss in-place
+        reweighting; fits must never run on stale weights.
+        """
+        fingerprint = self.fingerprint()
+        refresh = refresh or fingerprint != self._converted_fingerprint
+        self._converted_fingerprint = fingerprint
+        return to_graph_tool(self.graph, refresh=refresh)
+
+    def _fit_options(self) -> Dict:
+        return {
+            "edge_covariate": self.edge_covariate,
+            "rec_type": self.rec_type,
+            "mcmc_niter": self.mcmc_niter,
+            "refine_sweeps": self.refine_sweeps,
+            "refine_niter": self.refine_niter,
+        }
 
-    def convert_to_graphtool(self):
-        gt_graph = gt.Graph(directed=False)
-        node_index = {}
-        node_prop = gt_graph.new_vertex_property("string")
-
+    def fingerprint(self, **fit_args) -> str:
+        """Hash of the graph (node order, edges, weights, z-scores), the fit options and ``fit_args``."""
+        digest = hashlib.sha256()
+        digest.update(json.dumps({**self._fit_options(), **fit_args}, sort_keys=True).encode("utf-8"))
         for node in self.graph.nodes:
-            v = gt_graph.add_vertex()
-            node_index[node] = v
-            node_prop[v] = node
+            digest.update(f"n\t{node}\n".encode("utf-8"))
+        for u, v, data in self.graph.edges(data=True):
+            digest.update(f"e\t{u}\t{v}\t{data.get('weight')}\t{data.get('z')}\n".encode("utf-8"))
+        return digest.hexdigest()
+
+    def fit(self, cache_path: str = None, refit: bool = False, n_starts: int = 1, n_jobs: int = None,
+            seed: int = None):
+        """Fit the nested blockmodel once and reuse it for every later query.
 
-        for u, v in self.graph.edges:
-            gt_graph.add_edge(node_index[u], node_index[v])
+        With ``cache_path`` the state and its block levels are pickled together with
+        ``fingerprint()``; later fits of the same graph with the same options load them
+        instead of running the minimizer again. ``refit=True`` forces a new fit.
 
-        gt_graph.vertex_properties["name"] = node_prop
-        return gt_graph
+        ``n_starts > 1`` runs that many independent fits in a pool of ``n_jobs`` processes,
+        seeded ``seed, seed + 1, ...`` (``seed`` defaults to 0), and keeps the state with the
+        lowest description length; the spread is stored in ``fit_report``.
+
+        A state already in memory is reused only if it was fitted with the same fingerprint;
+        otherwise (different ``n_starts``/``seed``, options or graph) it is refitted.
+        """
+        fingerprint = self.fingerprint(n_starts=n_starts, seed=seed)
+        if self.state is not None and not refit:
+            if fingerprint == self.state_fingerprint:
+                return self.state
+            print("hSBM state in memory was fitted with different arguments, options or graph; refitting")
+        if cache_path and not refit and os.path.exists(cache_path):
+            with open(cache_path, "rb") as f:
+                saved = pickle.load(f)
+            if saved["fingerprint"] == fingerprint:
+                self.state = saved["state"]
+                self.state_fingerprint = fingerprint
+                self._block_levels = saved["block_levels"]
+                return self.state
+        if n_starts > 1:
+            self.state = self._fit_multistart(n_starts, n_jobs, 0 if seed is None else seed)
+        else:
+            if seed is not None:
+                import graph_tool.all as gt
+                gt.seed_rng(seed)
+                np.random.seed(seed)
+            self.state = self.minimize(nested=True)
+        self.state_fingerprint = fingerprint
+        self._block_levels = None
+        if cache_path:
+            self.save(cache_path, fingerprint)
+        return self.state
+
+    def _fit_multistart(self, n_starts: int, n_jobs: int, seed: int):
+        seeds = [seed + i for i in range(n_starts)]
+        with ProcessPoolExecutor(max_workers=n_jobs) as pool:
+            results = list(pool.map(_fit_nested_state, [self.graph] * n_starts, [self._fit_options()] * n_starts, seeds))
+        description_lengths = np.array([entropy for entropy, _ in results])
+        best = int(np.argmin(description_lengths))
+        self.fit_report = {
+            "seeds": seeds,
+            "description_lengths": description_lengths.tolist(),
+            "best_seed": seeds[best],
+            "min": float(description_lengths.min()),
+            "mean": float(description_lengths.mean()),
+            "max": float(description_lengths.max()),
+            "std": float(description_lengths.std()),
+        }
+        print(f"hSBM multi-start: best DL {self.fit_report['min']:.1f} (seed {seeds[best]}), "
+              f"mean {self.fit_report['mean']:.1f}, max {self.fit_report['max']:.1f}, "
+              f"std {self.fit_report['std']:.1f} over {n_starts} fits")
+        return results[best][1]
+
+    def save(self, path: str, fingerprint: str = None):
+        with open(path, "wb") as f:
+            pickle.dump({
+                "fingerprint": fingerprint or self.state_fingerprint or self.fingerprint(),
+                "state": self.state,
+                "block_levels": self.block_levels(),
+            }, f)
+
+    def block_levels(self) -> List[Dict[str, int]]:
+        """Block id of every node at each hierarchy level, derived once from the fitted state.
+
+        Levels are projected onto the original vertices, so the assignments nest: nodes sharing
+        a block at level ``l`` also share one at every level above it.
+        """
+        if self._block_levels is None:
+            state = self.state if self.state is not None else self.fit()
+            name_prop = state.g.vp["name"]
+            names = [name_prop[v] for v in state.g.vertices()]
+            self._block_levels = [
+                dict(zip(names, state.project_level(level).get_blocks().a.tolist()))
+                for level in range(len(state.get_levels()))
+            ]
+        return self._block_levels
+
+    def minimize(self, gt_graph=None, nested: bool = True):
+        """Fit a (nested) blockmodel with the configured covariates and refinement budget."""
+        import graph_tool.all as gt
+        if gt_graph is None:
+            gt_graph = self.convert_to_graphtool()
+        kwargs = {}
+        if self.edge_covariate is not None:
+            rec_type = self.rec_type or DEFAULT_REC_TYPES[self.edge_covariate]
+            kwargs["state_args"] = dict(recs=[gt_graph.ep[self.edge_covariate]], rec_types=[rec_type])
+        if self.mcmc_niter is not None:
+            kwargs["multilevel_mcmc_args"] = dict(niter=self.mcmc_niter)
+        if nested:
+            state = gt.minimize_nested_blockmodel_dl(gt_graph, **kwargs)
+        else:
+            state = gt.minimize_blockmodel_dl(gt_graph, **kwargs)
+        for _ in range(self.refine_sweeps):
+            state.multiflip_mcmc_sweep(beta=np.inf, niter=self.refine_niter)
+        return state
 
     def detect(self):
         gt_graph = self.convert_to_graphtool()
-        state = gt.minimize_blockmodel_dl(gt_graph)
+        state = self.minimize(gt_graph, nested=False)
         blocks = state.get_blocks()
         labels = {gt_graph.vp["name"][v]: int(blocks[v]) for v in gt_graph.vertices()}
         for node in self.graph.nodes:
@@ -160,63 +942,231 @@ class HSBMCommunityModel:
 
     def detect_add_level(self):
         """Assigns a 'levels' dict to each node, mapping each hierarchy level to its community assignment."""
-        gt_graph = self.convert_to_graphtool()
-        state = gt.minimize_nested_blockmodel_dl(gt_graph)
-        levels = state.get_levels()  # List of BlockState objects from top to bottom
-        name_prop = gt_graph.vp["name"]
-        for v in gt_graph.vertices():
-            node_name = name_prop[v]
-            self.graph.nodes[node_name]['levels'] = {}
-            for level_idx, block_state in enumerate(levels):
-                blocks = block_state.get_blocks()
-                self.graph.nodes[node_name]['levels'][level_idx] = int(blocks[v])
+        block_levels = self.block_levels()
+        for node in self.graph.nodes:
+            self.graph.nodes[node]['levels'] = {
+                level_idx: word_to_block[node] for level_idx, word_to_block in enumerate(block_levels)
+            }
         return self.graph
 
+class TopicDocumentIndex:
+    """Inverted index from (level, topic) to documents ranked by their share of the topic.
+
+    Each level holds CSR-style postings: sorted ``topic_ids``, an ``indptr`` into ``doc_ids`` and
+    ``scores``, with each topic's documents ordered by descending share (ties by doc id). Saved as
+    a flat ``.npz`` with keys ``L{level}_{array}`` so other tools can read it with NumPy alone.
+    """
+
+    ARRAYS = ("topic_ids", "indptr", "doc_ids", "scores")
+
+    def __init__(self, levels: Dict[int, Dict[str, np.ndarray]]):
+        self.levels = levels
+
+    @classmethod
+    def from_shares(cls, shares_by_level: Dict[int, tuple], threshold: float = 0.0) -> "TopicDocumentIndex":
+        levels = {}
+        for level, (topic_ids, shares) in shares_by_level.items():
+            shares = shares.tocsc()
+            topics = np.repeat(np.arange(len(topic_ids)), np.diff(shares.indptr))
+            keep = shares.data >= threshold
+            docs, scores, topics = shares.indices[keep], shares.data[keep], topics[keep]
+            order = np.lexsort((docs, -scores, topics))
+            levels[level] = {
+                "topic_ids": np.asarray(topic_ids, dtype=np.int64),
+                "indptr": np.concatenate([[0], np.cumsum(np.bincount(topics, minlength=len(topic_ids)))]),
+                "doc_ids": docs[order].astype(np.int64),
+                "scores": scores[order],
+            }
+        return cls(levels)
+
+    def _postings(self, topic: int, level: int) -> slice:
+        postings = self.levels.get(level)
+        if postings is None:
+            return slice(0, 0)
+        pos = int(np.searchsorted(postings["topic_ids"], topic))
+        if pos == len(postings["topic_ids"]) or postings["topic_ids"][pos] != topic:
+            return slice(0, 0)
+        return slice(int(postings["indptr"][pos]), int(postings["indptr"][pos + 1]))
+
+    def topics(self, level: int = -1) -> List[int]:
+        """Topics at ``level`` that have at least one document."""
+        postings = self.levels.get(level)
+        if postings is None:
+            return []
+        non_empty = np.diff(postings["indptr"]) > 0
+        return postings["topic_ids"][non_empty].tolist()
+
+    def top_documents(self, topic: int, level: int = -1, k: int = 5) -> List[Tuple[int, float]]:
+        """The ``k`` most representative ``(doc_id, share)`` pairs of a topic."""
+        span = self._postings(topic, level)
+        postings = self.levels.get(level)
+        if span.stop == span.start:
+            return []
+        end = min(span.stop, span.start + k)
+        return list(zip(postings["doc_ids"][span.start:end].tolist(), postings["scores"][span.start:end].tolist()))
+
+    def document_count(self, topic: int, level: int = -1) -> int:
+        span = self._postings(topic, level)
+        return span.stop - span.start
+
+    def save(self, path: str):
+        np.savez(path, **{
+            f"L{level}_{name}": postings[name]
+            for level, postings in self.levels.items()
+            for name in self.ARRAYS
+        })
+
+    @classmethod
+    def load(cls, path: str) -> "TopicDocumentIndex":
+        levels = defaultdict(dict)
+        with np.load(path) as arrays:
+            for key in arrays.files:
+                level, name = key[1:].split("_", 1)
+                levels[int(level)][name] = arrays[key]
+        return cls(dict(levels))
+
+
 # Topic Mapping: Assign topics to documents based on graph communities
 class TopicDocumentMapper:
-    def __init__(self, graph: nx.Graph, documents: List[str], preprocess_fn, block_levels: List[Dict[str, int]] = None):
+    def __init__(self, graph: nx.Graph, documents: List[str], preprocess_fn, block_levels: List[Dict[str, int]] = None,
+                 model: HSBMCommunityModel = None, doc_term: sparse.csr_matrix = None, vocab: Dict[str, int] = None):
+        """
+        ``doc_term``/``vocab`` may be the builder's ``doc_term`` and ``vocab`` (``keep_doc_term=True``)
+        for the same documents; the mapper then skips preprocessing entirely.
+        """
         self.graph = graph
         self.documents = documents
         self.preprocess_fn = preprocess_fn
+        self.model = model  # Optional fitted hSBM, shared with level extraction and topic trees
+        if block_levels is None and model is not None:
+            block_levels = model.block_levels()
         self.block_levels = block_levels  # Optional multilevel block assignments from hSBM
+        self._doc_tokens = None
+        self._doc_term = doc_term
+        self._vocab = vocab
+        self._owns_doc_term = doc_term is None  # Built from graph/block vocabulary; rebuilt when it grows
+        # Memoized per level and reused only while the level's word -> community assignment is unchanged
+        self._shares = {}  # level -> (assignment, topic ids, documents x topics share matrix)
+        self._shares_version = 0  # Bumped whenever any level's shares are recomputed
+        self._index = None  # (threshold, levels, shares version, TopicDocumentIndex)
+
+    def _document_tokens(self) -> List[List[str]]:
+        """Preprocess every document once per mapper; later levels and exports reuse the token lists."""
+        if self._doc_tokens is None:
+            self._doc_tokens = [self.preprocess_fn(doc) for doc in self.documents]
+        return self._doc_tokens
+
+    def _resolve_level(self, level: int) -> int:
+        """hSBM level index, or -1 for the flat ``community`` node attribute."""
+        return level if self.block_levels and 0 <= level < len(self.block_levels) else -1
+
+    def _word_to_comm(self, level: int) -> Dict[str, int]:
+        if self._resolve_level(level) >= 0:
+            return self.block_levels[level]
+        return {
+            word: data["community"]
+            for word, data in self.graph.nodes(data=True)
+            if "community" in data
+        }
 
-    def map_documents_to_topics(self, threshold: float = 0.3, level: int = -1) -> Dict[int, List[int]]:
-        topic_docs = defaultdict(list)
+    def _document_term_matrix(self):
+        """Sparse documents x terms count matrix, built once and shared by every level."""
+        if self._doc_term is None:
+            vocab = {word: idx for idx, word in enumerate(self.graph.nodes)}
+            for word_to_block in self.block_levels or []:
+                for word in word_to_block:
+                    vocab.setdefault(word, len(vocab))
+            indptr, indices = [0], []
+            for tokens in self._document_tokens():
+                indices.extend(vocab[word] for word in tokens if word in vocab)
+                indptr.append(len(indices))
+            self._doc_term = sparse.csr_matrix(
+                (np.ones(len(indices), dtype=np.int64), indices, indptr), shape=(len(indptr) - 1, len(vocab))
+            )
+            self._doc_term.sum_duplicates()
+            self._vocab = vocab
+        return self._doc_term, self._vocab
+
+    def _term_topic_matrix(self, word_to_comm: Dict[str, int], vocab: Dict[str, int]):
+        """Return ``(topic ids, terms x topics indicator matrix)`` for one level's assignment."""
+        known = [(vocab[word], comm) for word, comm in word_to_comm.items() if word in vocab]
+        rows = np.fromiter((idx for idx, _ in known), dtype=np.int64, count=len(known))
+        comms = np.fromiter((comm for _, comm in known), dtype=np.int64, count=len(known))
+        topic_ids, cols = np.unique(comms, return_inverse=True)
+        indicator = sparse.csr_matrix(
+            (np.ones(len(rows), dtype=np.int64), (rows, cols)), shape=(len(vocab), len(topic_ids))
+        )
+        return topic_ids, indicator
+
+    def _refresh_shares(self, levels: List[int]):
+        """Recompute the shares of every level in ``levels`` whose community assignment changed,
+        e.g. after a new ``detect`` or edited ``block_levels``."""
+        assignments = {level: self._word_to_comm(level) for level in levels}
+        stale = [level for level in levels if level not in self._shares or self._shares[level][0] != assignments[level]]
+        if stale:
+            self._compute_shares(stale, assignments)
+
+    def _compute_shares(self, levels: List[int], assignments: Dict[int, Dict[str, int]]):
+        """Score all documents against every level in ``levels`` with one sparse product."""
+        doc_term, vocab = self._document_term_matrix()
+        if self._owns_doc_term and any(word not in vocab for level in levels for word in assignments[level]):
+            self._doc_term = None
+            doc_term, vocab = self._document_term_matrix()
+        blocks = [self._term_topic_matrix(assignments[level], vocab) for level in levels]
+        scores = (doc_term @ sparse.hstack([indicator for _, indicator in blocks], format="csr")).tocsc()
+        offset = 0
+        for level, (topic_ids, _) in zip(levels, blocks):
+            level_scores = scores[:, offset:offset + len(topic_ids)].tocsr()
+            offset += len(topic_ids)
+            totals = np.asarray(level_scores.sum(axis=1)).ravel()
+            shares = level_scores.astype(np.float64)
+            shares.data = level_scores.data / np.repeat(totals, np.diff(level_scores.indptr))
+            self._shares[level] = (dict(assignments[level]), topic_ids, shares)
+        self._shares_version += 1
+
+    def topic_shares(self, level: int = -1):
+        """Return ``(topic ids, shares)``: each document's share of its topic-mapped tokens per topic.
+
+        ``shares`` is a sparse documents x topics matrix whose columns follow ``topic ids``.
+        """
+        level = self._resolve_level(level)
+        self._refresh_shares([level])
+        return self._shares[level][1:]
 
-        if self.block_levels and 0 <= level < len(self.block_levels):
-            word_to_comm = self.block_levels[level]
-        else:
-            word_to_comm = {
-                word: data["community"]
-                for word, data in self.graph.nodes(data=True)
-                if "community" in data
-            }
+    def map_documents_to_topics(self, threshold: float = 0.3, level: int = -1) -> Dict[int, List[int]]:
+        topic_ids, shares = self.topic_shares(level)
+        selected = shares.tocsc()
+        selected.data = (selected.data >= threshold).astype(np.int8)
+        selected.eliminate_zeros()
+        return {
+            int(topic_ids[col]): selected.indices[selected.indptr[col]:selected.indptr[col + 1]].tolist()
+            for col in range(len(topic_ids))
+            if selected.indptr[col + 1] > selected.indptr[col]
+        }
 
-        for doc_id, doc in enumerate(self.documents):
-            word_counts = Counter(self.preprocess_fn(doc))
-            score_by_comm = defaultdict(int)
-            total = 0
-            for word, count in word_counts.items():
-                if word in word_to_comm:
-                    comm = word_to_comm[word]
-                    score_by_comm[comm] += count
-                    total += count
+    def map_documents_to_all_levels(self, threshold: float = 0.3) -> Dict[int, Dict[int, List[int]]]:
+        """Topic -> documents for every hSBM level (or the flat communities), scored in a single pass."""
+        levels = list(range(len(self.block_levels))) if self.block_levels else [-1]
+        self._refresh_shares(levels)
+        return {level: self.map_documents_to_topics(threshold=threshold, level=level) for level in levels}
 
-            for comm, score in score_by_comm.items():
-                if total > 0 and score / total >= threshold:
-                    topic_docs[comm].append(doc_id)
+    def build_topic_index(self, threshold: float = 0.3) -> TopicDocumentIndex:
+        """Rank each topic's documents by share, for every hSBM level and the flat communities.
 
-        return dict(topic_docs)
+        The index is memoized per threshold until a level's communities change; ``save`` it for
+        the dashboard or later sessions.
+        """
+        levels = list(range(len(self.block_levels))) if self.block_levels else []
+        if any("community" in data for _, data in self.graph.nodes(data=True)):
+            levels.append(-1)
+        self._refresh_shares(levels)
+        if self._index is None or self._index[:3] != (threshold, levels, self._shares_version):
+            index = TopicDocumentIndex.from_shares({level: self._shares[level][1:] for level in levels}, threshold)
+            self._index = (threshold, levels, self._shares_version, index)
+        return self._index[3]
 
     def get_topic_keywords(self, top_k: int = 5, level: int = -1) -> Dict[int, List[str]]:
-        if self.block_levels and 0 <= level < len(self.block_levels):
-            word_to_comm = self.block_levels[level]
-        else:
-            word_to_comm = {
-                word: data["community"]
-                for word, data in self.graph.nodes(data=True)
-                if "community" in data
-            }
+        word_to_comm = self._word_to_comm(level)
 
         grouped = defaultdict(list)
         for word in self.graph.nodes:
@@ -231,29 +1181,30 @@ class TopicDocumentMapper:
         return summaries
 
     def render_topic_summaries(self, top_k: int = 1, doc_length: int = 300, level: int = -1):
-        topic_docs = self.map_documents_to_topics(level=level)
+        index = self.build_topic_index()
         topic_terms = self.get_topic_keywords(top_k=5, level=level)
 
-        for comm_id in sorted(topic_docs):
+        for comm_id in index.topics(self._resolve_level(level)):
             print(f"\n--- Topic {comm_id} (Level {level}) ---")
             print("Keywords:", ", ".join(topic_terms.get(comm_id, [])))
-            for doc_idx in topic_docs[comm_id][:top_k]:
+            for doc_idx, _ in index.top_documents(comm_id, self._resolve_level(level), k=top_k):
                 snippet = re.sub(r"\s+", " ", self.documents[doc_idx]).strip()
                 print(f"\n[Doc {doc_idx}]\n", snippet[:doc_length], "...\n")
 
     def export_topic_summaries_markdown(self, output_path: str = "topic_summaries.md", top_k: int = 1, doc_length: int = 300, level: int = -1):
-        topic_docs = self.map_documents_to_topics(level=level)
+        index = self.build_topic_index()
         topic_terms = self.get_topic_keywords(top_k=5, level=level)
 
         with open(output_path, "w", encoding="utf-8") as f:
-            for comm_id in sorted(topic_docs):
+            for comm_id in index.topics(self._resolve_level(level)):
                 f.write(f"## Topic {comm_id} (Level {level})\n")
                 f.write(f"**Keywords**: {', '.join(topic_terms.get(comm_id, []))}\n\n")
-                for doc_idx in topic_docs[comm_id][:top_k]:
+                for doc_idx, _ in index.top_documents(comm_id, self._resolve_level(level), k=top_k):
                     snippet = re.sub(r"\s+", " ", self.documents[doc_idx]).strip()
                     f.write(f"**Document {doc_idx}**:\n\n{snippet[:doc_length]}...\n\n")
 
     def draw_cluster_tree(self, state, output_file="topic_tree.pdf"):
+        from graph_tool.all import draw_hierarchy, NestedBlockState
         if not isinstance(state, NestedBlockState):
             print("Error: 'state' must be a NestedBlockState with hierarchy.")
             return
@@ -265,6 +1216,7 @@ class TopicDocumentMapper:
                                       edge_pen_width: float = 0.5,
                                       vertex_size: float = 1.0,
                                       layout="sfdp"):
+        from graph_tool.all import draw_hierarchy, NestedBlockState
         if not isinstance(state, NestedBlockState):
             print("Error: 'state' must be a NestedBlockState with hierarchy.")
             return
@@ -312,6 +1264,7 @@ class TopicDocumentMapper:
             links["target"].append(node_map[tgt_key])
             links["value"].append(count)
 
+        import plotly.graph_objects as go
         fig = go.Figure(go.Sankey(
             node=dict(label=labels),
             link=dict(
@@ -323,27 +1276,30 @@ class TopicDocumentMapper:
         fig.show()
 
 
-    def generate_community_labels(self, level: int = -1, method: str = "heuristic", top_k: int = 5, save_path: str = None) -> Dict[int, str]:
+    def generate_community_labels(self, level: int = -1, method: str = "heuristic", top_k: int = 5, save_path: str = None,
+                                  labeler: CommunityLabeler = None, label_cache: str = "label_cache.sqlite") -> Dict[int, str]:
+        """Label every community at ``level``.
+
+        ``method="llm"`` sends all communities through ``labeler`` (default: a CommunityLabeler
+        on the OpenAI API), which runs requests concurrently with retries. The default labeler
+        caches labels in ``label_cache``, placed next to ``save_path`` when that is given, so
+        reruns only ask for communities whose keywords changed; ``label_cache=None`` disables it.
+        """
         keywords_by_comm = self.get_topic_keywords(top_k=top_k, level=level)
-        labels = {}
-
-        for comm_id, keywords in keywords_by_comm.items():
-            if method == "heuristic":
-                labels[comm_id] = keywords[0] if keywords else f"Topic {comm_id}"
-            elif method == "llm":
-                prompt = f"What is a concise scientific topic label for the following keywords: {', '.join(keywords)}?"
-                try:
-                    response = openai.ChatCompletion.create(
-                        model="gpt-4",
-                        messages=[{"role": "user", "content": prompt}],
-                        temperature=0.3
-                    )
-                    labels[comm_id] = response["choices"][0]["message"]["content"].strip()
-                except Exception as e:
+
+        if method == "llm":
+            if labeler is None:
+                if label_cache and save_path and not os.path.dirname(label_cache):
+                    label_cache = os.path.join(os.path.dirname(save_path), label_cache)
+                labeler = CommunityLabeler(cache=label_cache)
+            labels = labeler.label(keywords_by_comm)
+        else:
+            labels = {}
+            for comm_id, keywords in keywords_by_comm.items():
+                if method == "heuristic":
+                    labels[comm_id] = keywords[0] if keywords else f"Topic {comm_id}"
+                else:
                     labels[comm_id] = f"Topic {comm_id}"
-                    print(f"LLM error for community {comm_id}: {e}")
-            else:
-                labels[comm_id] = f"Topic {comm_id}"
 
         if save_path:
             import csv
@@ -357,34 +1313,22 @@ class TopicDocumentMapper:
 
     def generate_interactive_graph(self, output_file="interactive_graph.html",
                                    width="1000px", height="700px"):
+        from pyvis.network import Network
         net = Network(width=width, height=height, notebook=False, cdn_resources="in_line")
         net.from_nx(self.graph)
         net.show_buttons(filter_=['physics'])
         net.write_html(output_file)
         print(f"Graph saved to {output_file}")
 
-    def convert_to_graphtool(self) -> "gt.Graph":
+    def convert_to_graphtool(self, refresh: bool = False) -> "gt.Graph":
         """Convert the internal NetworkX graph to a graph-tool Graph.
 
         Returns:
-            gt.Graph: The converted undirected graph-tool graph with node names as a vertex property.
+            gt.Graph: The converted undirected graph-tool graph with node names as a vertex property
+            and ``weight``/``z`` edge properties. Cached; see ``gt_conversion.to_graph_tool``, and pass
+            ``refresh=True`` after editing edges in place.
         """
-        import graph_tool.all as gt
-
-        gt_graph = gt.Graph(directed=False)
-        node_index = {}
-        name_prop = gt_graph.new_vertex_property("string")
-
-        for node in self.graph.nodes:
-            v = gt_graph.add_vertex()
-            node_index[node] = v
-            name_prop[v] = node
-
-        for u, v in self.graph.edges:
-            gt_graph.add_edge(node_index[u], node_index[v])
-
-        gt_graph.vertex_properties["name"] = name_prop
-        return gt_graph
+        return to_graph_tool(self.graph, refresh=refresh)
 
     def generate_topic_tree(
         self,
@@ -399,91 +1343,196 @@ class TopicDocumentMapper:
             print("At least two block levels required for topic tree.")
             return
 
-        gt_graph = self.convert_to_graphtool()
         import graph_tool.all as gt
 
-        # Fit nested block model
-        state = gt.minimize_nested_blockmodel_dl(gt_graph)
-        bs = state.get_bs()  # List of lists: block sizes at each level
-
-        # Mark small clusters as empty by setting their size to zero
-        for level, sizes in enumerate(bs):
-            for idx, size in enumerate(sizes):
-                if size < min_cluster_size:
-                    bs[level][idx] = 0
+        # Reuse the fitted nested block model, fitting one only if none was provided
+        if self.model is None:
+            self.model = HSBMCommunityModel(self.graph)
+        state = self.model.state if self.model.state is not None else self.model.fit()
+
+        # Hide terms of small bottom-level clusters through per-vertex/edge sizes; the fitted state
+        # is shared with block_levels() and save(), so its block maps must not be modified
+        g = state.g
+        blocks = np.asarray(state.get_bs()[0])
+        small = np.bincount(blocks)[blocks] < min_cluster_size
+        vertex_sizes = g.new_vertex_property("double", vals=np.where(small, 0.0, vertex_size))
+        edges = g.get_edges([g.edge_index])
+        edge_widths = g.new_edge_property("double")
+        edge_widths.a[edges[:, 2]] = np.where(small[edges[:, 0]] | small[edges[:, 1]], 0.0, edge_pen_width)
 
         try:
             print(f"Rendering topic tree to {output_file} (min_cluster_size={min_cluster_size})...")
             gt.draw_hierarchy(
                 state,
                 output=output_file,
-                edge_pen_width=edge_pen_width,
-                vertex_size=vertex_size,
+                edge_pen_width=edge_widths,
+                vertex_size=vertex_sizes,
                 layout=layout,
-                empty_branches=True  # Hide clusters with size 0
+                empty_branches=False  # Prune upper-level blocks left without members
             )
             print(f"Topic tree saved to {output_file}")
         except Exception as e:
             import logging
             logging.error(f"Failed to generate topic tree: {e}")
 
-def assign_documents_to_communities(graph, documents, level):
-    # Build a mapping from community to node at this level
-    comm_to_nodes = {}
-    for node, data in graph.nodes(data=True):
-        comm = data['levels'].get(level)
-        if comm is not None:
-            comm_to_nodes.setdefault(comm, []).append(node)
-    # For each document, assign it to the community of its words
-    for doc in documents:
-        words = [w for w in doc.split() if w in graph.nodes]
+def assign_documents_to_communities(graph, documents, level, preprocess_fn=None, builder: "CooccurrenceGraphBuilder" = None,
+                                    doc_tokens: List[List[str]] = None):
+    """Assign each document to the most common community of its terms at ``level``.
+
+    Doc ids are stored once per community as sorted arrays in
+    ``graph.graph['community_documents'][level]`` rather than copying document text onto every
+    node. Resolve them to text with a DocumentStore; when ``documents`` is one, its corpus path is
+    recorded in ``graph.graph['corpus_path']`` for the dashboard.
+
+    Documents must be tokenized like the graph's lemmatized vocabulary. Pass ``doc_tokens``
+    (token lists in document order, e.g. kept from an earlier level) to skip preprocessing, or
+    ``builder`` to preprocess through its token cache; ``preprocess_fn`` tokenizes one document at
+    a time. By default a builder with the on-disk TokenCache is used, so calling this once per
+    level lemmatizes the corpus only once.
+    """
+    word_to_comm = {
+        node: data['levels'][level]
+        for node, data in graph.nodes(data=True)
+        if level in data.get('levels', {})
+    }
+    if doc_tokens is not None:
+        token_stream = doc_tokens
+    elif preprocess_fn is not None:
+        token_stream = (preprocess_fn(doc) for doc in documents)
+    else:
+        builder = builder or CooccurrenceGraphBuilder(token_cache=TokenCache())
+        token_stream = builder.preprocess_batch(documents)
+
+    comm_docs = defaultdict(list)
+    for doc_id, tokens in enumerate(token_stream):
         # Count which community appears most in this doc
         comm_counts = {}
-        for w in words:
-            comm = graph.nodes[w]['levels'].get(level)
+        for word in tokens:
+            comm = word_to_comm.get(word)
             if comm is not None:
                 comm_counts[comm] = comm_counts.get(comm, 0) + 1
         if comm_counts:
-            # Assign doc to the most common community in this doc
             main_comm = max(comm_counts, key=comm_counts.get)
-            for node in comm_to_nodes[main_comm]:
-                if 'documents' not in graph.nodes[node]:
-                    graph.nodes[node]['documents'] = []
-                graph.nodes[node]['documents'].append(doc)
+            comm_docs[main_comm].append(doc_id)
+
+    graph.graph.setdefault('community_documents', {})[level] = {
+        comm: np.array(doc_ids, dtype=np.int64) for comm, doc_ids in comm_docs.items()
+    }
+    if isinstance(documents, DocumentStore):
+        graph.graph['corpus_path'] = os.path.abspath(documents.corpus_path)
+    return graph.graph['community_documents'][level]
+
+class TopicHierarchy:
+    """Block hierarchy of a nested blockmodel as flat NumPy arrays, built in one pass per level.
+
+    ``blocks[l][t]`` is the block of term ``terms[t]`` at level ``l`` (level 0 is the finest; -1 if
+    unassigned). ``parents[l][b]`` is the level ``l + 1`` block containing block ``b`` of level ``l``.
+    Children (level ``l - 1`` blocks inside a level ``l`` block) and member terms are stored CSR-style,
+    so every query costs O(result size).
+    """
+
+    def __init__(self, terms: List[str], blocks: List[np.ndarray]):
+        self.terms = list(terms)
+        self.term_index = {term: idx for idx, term in enumerate(self.terms)}
+        self.blocks = [np.asarray(level_blocks, dtype=np.int64) for level_blocks in blocks]
+        self.parents, self._members, self._children = [], [], []
+        for level, level_blocks in enumerate(self.blocks):
+            assigned = np.flatnonzero(level_blocks >= 0)
+            n_blocks = int(level_blocks.max()) + 1 if len(assigned) else 0
+            self._members.append(self._group(level_blocks[assigned], assigned, n_blocks))
+            child_parents = self.parents[level - 1] if level > 0 else np.empty(0, dtype=np.int64)
+            children = np.flatnonzero(child_parents >= 0)
+            self._children.append(self._group(child_parents[children], children, n_blocks))
+            parents = np.full(n_blocks, -1, dtype=np.int64)
+            if level + 1 < len(self.blocks):
+                # Nested levels: every term of a block has the same parent, so any of them will do
+                parents[level_blocks[assigned]] = self.blocks[level + 1][assigned]
+            self.parents.append(parents)
+
+    @staticmethod
+    def _group(keys: np.ndarray, values: np.ndarray, n_keys: int):
+        order = np.argsort(keys, kind="stable")
+        indptr = np.concatenate([[0], np.cumsum(np.bincount(keys, minlength=n_keys))])
+        return indptr, values[order]
+
+    @classmethod
+    def from_block_levels(cls, block_levels: List[Dict[str, int]]) -> "TopicHierarchy":
+        terms = list(dict.fromkeys(term for word_to_block in block_levels for term in word_to_block))
+        blocks = [
+            np.fromiter((word_to_block.get(term, -1) for term in terms), dtype=np.int64, count=len(terms))
+            for word_to_block in block_levels
+        ]
+        return cls(terms, blocks)
+
+    @classmethod
+    def from_state(cls, state) -> "TopicHierarchy":
+        """Build directly from a fitted NestedBlockState whose graph has a ``name`` vertex property."""
+        name_prop = state.g.vp["name"]
+        terms = [name_prop[v] for v in state.g.vertices()]
+        blocks = [state.project_level(level).get_blocks().a for level in range(len(state.get_levels()))]
+        return cls(terms, blocks)
+
+    @classmethod
+    def from_graph(cls, graph: nx.Graph) -> "TopicHierarchy":
+        """Build from the per-node ``levels`` dicts written by ``HSBMCommunityModel.detect_add_level``."""
+        block_levels = defaultdict(dict)
+        for node, data in graph.nodes(data=True):
+            for level, comm in data.get("levels", {}).items():
+                block_levels[level][node] = comm
+        return cls.from_block_levels([block_levels[level] for level in sorted(block_levels)])
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """Compact form (terms and a levels x terms block matrix); the other arrays are derived."""
+        return {
+            "terms": np.array(self.terms, dtype=str),
+            "blocks": np.vstack(self.blocks) if self.blocks else np.empty((0, 0), dtype=np.int64),
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays) -> "TopicHierarchy":
+        return cls([str(term) for term in arrays["terms"]], list(arrays["blocks"]))
+
+    @property
+    def n_levels(self) -> int:
+        return len(self.blocks)
+
+    def block_of(self, term: str, level: int) -> int:
+        return int(self.blocks[level][self.term_index[term]])
+
+    def parent(self, level: int, block: int) -> Optional[int]:
+        parent = int(self.parents[level][block])
+        return parent if parent >= 0 else None
+
+    def ancestors(self, level: int, block: int) -> List[Tuple[int, int]]:
+        """``(level, block)`` of every enclosing block, from the direct parent to the top."""
+        chain = []
+        while level + 1 < self.n_levels:
+            parent = self.parent(level, block)
+            if parent is None:
+                break
+            level, block = level + 1, parent
+            chain.append((level, block))
+        return chain
+
+    def children(self, level: int, block: int) -> List[int]:
+        """Blocks of level ``level - 1`` nested inside ``block``."""
+        indptr, children = self._children[level]
+        return children[indptr[block]:indptr[block + 1]].tolist()
+
+    def members(self, level: int, block: int) -> List[str]:
+        indptr, members = self._members[level]
+        return [self.terms[idx] for idx in members[indptr[block]:indptr[block + 1]].tolist()]
+
 
 def assign_subtopics(graph):
-    # Find the maximum level in the graph
-    max_level = max(
-        (max(data['levels'].keys()) for _, data in graph.nodes(data=True) if 'levels' in data and data['levels']),
-        default=0
-    )
-    for level in range(max_level):
-        # Build a mapping: (level, community) -> set of nodes at that level/community
-        comm_to_nodes = {}
-        for node, data in graph.nodes(data=True):
-            comm = data['levels'].get(level)
-            if comm is not None:
-                comm_to_nodes.setdefault((level, comm), set()).add(node)
-        # Build a mapping: (level+1, community) -> set of nodes at that level/community
-        next_comm_to_nodes = {}
-        for node, data in graph.nodes(data=True):
-            comm = data['levels'].get(level + 1)
-            if comm is not None:
-                next_comm_to_nodes.setdefault((level + 1, comm), set()).add(node)
-        # For each node at this level, find all nodes at next level that are descendants
-        for node, data in graph.nodes(data=True):
-            comm = data['levels'].get(level)
-            if comm is not None:
-                # Find all next-level communities that contain nodes from this community
-                subtopics = set()
-                for (l, next_comm), nodes_in_next in next_comm_to_nodes.items():
-                    if l == level + 1:
-                        # If any node in nodes_in_next is also in this community at this level, it's a descendant
-                        if nodes_in_next & comm_to_nodes.get((level, comm), set()):
-                            subtopics.update(nodes_in_next & comm_to_nodes.get((level, comm), set()))
-                if 'subtopics' not in data:
-                    data['subtopics'] = {}
-                data['subtopics'][level + 1] = list(subtopics - {node})  # Exclude self if present
+    """Attach the block hierarchy to the graph as ``graph.graph['hierarchy']`` and return it.
+
+    Replaces the per-node ``subtopics`` copies: the co-members of a node's community at any
+    level are answered from the shared arrays via ``TopicHierarchy.members``.
+    """
+    hierarchy = TopicHierarchy.from_graph(graph)
+    graph.graph['hierarchy'] = hierarchy.to_arrays()
+    return hierarchy
 
 def assign_keywords(graph, level, top_k=5):
     # Build a mapping from community to nodes at this level
@@ -502,3 +1551,11 @@ def assign_keywords(graph, level, top_k=5):
             if 'keywords' not in graph.nodes[node]:
                 graph.nodes[node]['keywords'] = []
             graph.nodes[node]['keywords'] = keywords
+
+
+if __name__ == "__main__":
+    if sys.argv[1:] == ["setup"]:
+        setup_resources()
+    else:
+        print("usage: python cooccurrence.py setup    # download the spaCy model and NLTK data")
+        sys.exit(2)
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import mmap
+import os
+from typing import Iterator
+
+import numpy as np
+
+# Bytes hashed at each end of the previously indexed corpus to tell appends from rewrites
+SIGNATURE_BYTES = 1 << 16
+
+
+class DocumentStore:
+    """Read-only access to the documents of a one-document-per-line corpus by integer id.
+
+    The corpus is memory-mapped and never loaded as Python strings. Line boundaries are computed
+    once and saved next to the corpus as ``<corpus>.offsets.npy`` (``n_docs + 1`` byte offsets, the
+    last one being the corpus size), with the corpus size, mtime and a hash of its first and last
+    bytes in ``<corpus>.offsets.json``. The offsets are reused only while size and mtime are
+    unchanged. When the corpus has only grown since, e.g. through ``persist_pdf_text_to_corpus``,
+    and the hashed bytes still match, just the appended tail is scanned; any other change rescans
+    the whole file. If the offsets cannot be written (read-only location), they are kept in memory.
+
+    Lines end at ``\n`` only, and documents are returned with their trailing newline exactly as
+    ``iter_corpus`` yields them (a file opened with ``newline="\n"``), so doc ids and token cache keys
+    match those of a build that streamed the same file.
+    """
+
+    def __init__(self, corpus_path: str, offsets_path: str = None):
+        self.corpus_path = corpus_path
+        self.offsets_path = offsets_path or corpus_path + ".offsets.npy"
+        self.meta_path = os.path.splitext(self.offsets_path)[0] + ".json"
+        self._file = open(corpus_path, "rb")
+        stat = os.fstat(self._file.fileno())
+        # mmap cannot map an empty file
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if stat.st_size else b""
+        self.offsets = self._load_offsets(stat.st_size, stat.st_mtime_ns)
+
+    def _scan(self, start: int) -> np.ndarray:
+        tail = np.frombuffer(self._map, dtype=np.uint8)[start:]
+        return np.flatnonzero(tail == ord("\n")) + start + 1
+
+    def _signature(self, end: int) -> str:
+        """Hash of the first and last SIGNATURE_BYTES of the corpus up to byte ``end``."""
+        digest = hashlib.sha256(self._map[:min(end, SIGNATURE_BYTES)])
+        digest.update(self._map[max(0, end - SIGNATURE_BYTES):end])
+        return digest.hexdigest()
+
+    def _load_offsets(self, size: int, mtime_ns: int) -> np.ndarray:
+        offsets = None
+        if os.path.exists(self.offsets_path) and os.path.exists(self.meta_path):
+            with open(self.meta_path, encoding="utf-8") as f:
+                meta = json.load(f)
+            offsets = np.load(self.offsets_path, mmap_mode="r")
+            indexed = len(offsets) > 0 and offsets[-1] == meta["size"]
+            if indexed and meta["size"] == size and meta["mtime_ns"] == mtime_ns:
+                return offsets
+            if not (indexed and meta["size"] < size and self._signature(meta["size"]) == meta["signature"]):
+                offsets = None  # Corpus was rewritten rather than appended to; rescan from scratch
+        if offsets is None:
+            offsets = np.zeros(1, dtype=np.int64)
+        elif offsets[-1] > 0 and self._map[offsets[-1] - 1:offsets[-1]] != b"\n":
+            offsets = offsets[:-1]  # Last document was unterminated and may have grown
+        line_ends = self._scan(int(offsets[-1]))
+        offsets = np.concatenate([offsets, line_ends])
+        if offsets[-1] != size:
+            offsets = np.append(offsets, size)
+        self._save_offsets(offsets, {"size": size, "mtime_ns": mtime_ns, "signature": self._signature(size)})
+        return offsets
+
+    def _save_offsets(self, offsets: np.ndarray, meta: dict):
+        try:
+            # Write beside and rename, so readers never map a half-written (or truncated) file
+            with open(self.offsets_path + ".tmp", "wb") as f:
+                np.save(f, offsets)
+            os.replace(self.offsets_path + ".tmp", self.offsets_path)
+            with open(self.meta_path, "w", encoding="utf-8") as f:
+                json.dump(meta, f)
+        except OSError:
+            pass  # Read-only location: the offsets are recomputed on the next open
+
+    def __len__(self) -> int:
+        return len(self.offsets) - 1
+
+    def __getitem__(self, doc_id: int) -> str:
+        if not -len(self) <= doc_id < len(self):
+            raise IndexError(f"Document id {doc_id} out of range")
+        doc_id %= len(self)
+        return self._map[self.offsets[doc_id]:self.offsets[doc_id + 1]].decode("utf-8")
+
+    def __iter__(self) -> Iterator[str]:
+        for doc_id in range(len(self)):
+            yield self[doc_id]
@@ -0,0 +1,60 @@
+import weakref
+
+import networkx as nx
+import numpy as np
+
+# Edge attributes written by CooccurrenceGraphBuilder and carried over as graph-tool edge properties
+EDGE_PROPERTIES = ("weight", "z")
+
+_converted = weakref.WeakKeyDictionary()
+
+
+def graph_signature(nx_graph: nx.Graph) -> tuple:
+    """Cheap identity of a graph's structure, used to invalidate cached conversions."""
+    return nx_graph.graph.get("revision", 0), nx_graph.number_of_nodes(), nx_graph.number_of_edges()
+
+
+def to_graph_tool(nx_graph: nx.Graph, refresh: bool = False) -> "gt.Graph":
+    """Convert an undirected networkx graph to a graph-tool Graph in bulk.
+
+    Vertices follow ``nx_graph.nodes`` order and carry a ``name`` vertex property; the ``weight``
+    and ``z`` edge attributes become edge properties of the same names (missing values default to
+    1 and 0). Edges are added in one ``add_edge_list`` call from NumPy arrays.
+
+    The result is cached per graph and reused while ``graph_signature`` is unchanged. The builder
+    bumps ``graph.graph["revision"]`` whenever it edits edges; pass ``refresh=True`` after other
+    in-place edits (``HSBMCommunityModel.convert_to_graphtool`` does so itself when the graph's
+    content fingerprint changed). The returned graph is shared, so callers must not modify it.
+    """
+    import graph_tool.all as gt
+
+    signature = graph_signature(nx_graph)
+    cached = _converted.get(nx_graph)
+    if cached is not None and not refresh and cached[0] == signature:
+        return cached[1]
+
+    nodes = list(nx_graph.nodes)
+    index = {node: i for i, node in enumerate(nodes)}
+    n_edges = nx_graph.number_of_edges()
+    edges = nx_graph.edges(data=True)
+    edge_list = np.column_stack([
+        np.fromiter((index[u] for u, _, _ in edges), dtype=np.float64, count=n_edges),
+        np.fromiter((index[v] for _, v, _ in edges), dtype=np.float64, count=n_edges),
+        np.fromiter((data.get("weight", 1) for _, _, data in edges), dtype=np.float64, count=n_edges),
+        np.fromiter((data.get("z", 0.0) for _, _, data in edges), dtype=np.float64, count=n_edges),
+    ])
+
+    gt_graph = gt.Graph(directed=False)
+    gt_graph.add_vertex(len(nodes))
+    name_prop = gt_graph.new_vertex_property("string")
+    for v, node in zip(gt_graph.vertices(), nodes):
+        name_prop[v] = node
+    edge_props = [gt_graph.new_edge_property("double") for _ in EDGE_PROPERTIES]
+    gt_graph.add_edge_list(edge_list, eprops=edge_props)
+
+    gt_graph.vertex_properties["name"] = name_prop
+    for attr, prop in zip(EDGE_PROPERTIES, edge_props):
+        gt_graph.edge_properties[attr] = prop
+
+    _converted[nx_graph] = (signature, gt_graph)
+    return gt_graph
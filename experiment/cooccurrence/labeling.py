@@ -0,0 +1,204 @@
+import asyncio
+import hashlib
+import json
+import random
+import re
+import sqlite3
+import urllib.request
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Hashable, List, Optional, Sequence, Union
+
+LABEL_PROMPT = "What is a concise scientific topic label for the following keywords: {keywords}?"
+BATCH_PROMPT = (
+    "Give a concise scientific topic label for each numbered keyword list below. Answer with exactly "
+    "one line per list in the form '<number>. <label>' and nothing else.\n\n{lists}"
+)
+
+
+class LabelClient(ABC):
+    """Chat backend used by CommunityLabeler; subclasses implement one completion request."""
+
+    @abstractmethod
+    async def complete(self, prompt: str, model: str, temperature: float) -> str:
+        raise NotImplementedError
+
+
+class OpenAIClient(LabelClient):
+    """OpenAI chat completions (``openai>=1`` async client, or the legacy ``ChatCompletion.acreate``)."""
+
+    def __init__(self, api_key: str = None, base_url: str = None):
+        import openai
+        self._openai = openai
+        self._client = openai.AsyncOpenAI(api_key=api_key, base_url=base_url) if hasattr(openai, "AsyncOpenAI") else None
+
+    async def complete(self, prompt: str, model: str, temperature: float) -> str:
+        messages = [{"role": "user", "content": prompt}]
+        if self._client is not None:
+            response = await self._client.chat.completions.create(model=model, messages=messages, temperature=temperature)
+            return response.choices[0].message.content
+        response = await self._openai.ChatCompletion.acreate(model=model, messages=messages, temperature=temperature)
+        return response["choices"][0]["message"]["content"]
+
+
+class HTTPChatClient(LabelClient):
+    """Any OpenAI-compatible ``/chat/completions`` endpoint, e.g. a local stand-in server for tests.
+
+    Uses only the standard library; requests run in worker threads so they overlap.
+    """
+
+    def __init__(self, base_url: str = "http://localhost:8000/v1", api_key: str = None, timeout: float = 60.0):
+        self.url = base_url.rstrip("/") + "/chat/completions"
+        self.api_key = api_key
+        self.timeout = timeout
+
+    def _post(self, payload: Dict) -> Dict:
+        headers = {"Content-Type": "application/json"}
+        if self.api_key:
+            headers["Authorization"] = f"Bearer {self.api_key}"
+        request = urllib.request.Request(self.url, data=json.dumps(payload).encode("utf-8"), headers=headers)
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            return json.load(response)
+
+    async def complete(self, prompt: str, model: str, temperature: float) -> str:
+        payload = {"model": model, "messages": [{"role": "user", "content": prompt}], "temperature": temperature}
+        response = await asyncio.to_thread(self._post, payload)
+        return response["choices"][0]["message"]["content"]
+
+
+class LabelCache:
+    """Labels persisted in SQLite, keyed by the keyword set, the prompt template and the model."""
+
+    def __init__(self, path: str = "label_cache.sqlite"):
+        self.path = path
+        self.conn = sqlite3.connect(path, check_same_thread=False)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS labels (key TEXT PRIMARY KEY, label TEXT NOT NULL)")
+        self.conn.commit()
+
+    @staticmethod
+    def key(keywords: Sequence[str], prompt: str, model: str) -> str:
+        payload = json.dumps({"keywords": sorted(keywords), "prompt": prompt, "model": model}, sort_keys=True)
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        row = self.conn.execute("SELECT label FROM labels WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else None
+
+    def put(self, key: str, label: str):
+        self.conn.execute("INSERT OR REPLACE INTO labels (key, label) VALUES (?, ?)", (key, label))
+        self.conn.commit()
+
+    def close(self):
+        self.conn.close()
+
+
+class CommunityLabeler:
+    """Label communities from their keywords with concurrent, retried and cached LLM requests.
+
+    At most ``max_concurrency`` requests are in flight. Failed requests are retried up to
+    ``max_retries`` times with exponential backoff and jitter starting at ``backoff`` seconds;
+    communities that still fail get ``Topic <id>`` and are not cached. With ``batch_size > 1``,
+    that many communities share ``batch_prompt``; if a batched answer cannot be parsed, its
+    communities are asked for one by one with ``prompt``.
+
+    Labels are cached on disk by default (``cache`` is a LabelCache or a path; None disables
+    caching), keyed by the keywords, the model and every prompt template that can produce them.
+    """
+
+    def __init__(self, client: LabelClient = None, model: str = "gpt-4",
+                 cache: Union[LabelCache, str, None] = "label_cache.sqlite", max_concurrency: int = 8,
+                 max_retries: int = 5, backoff: float = 1.0, batch_size: int = 1, temperature: float = 0.3,
+                 prompt: str = LABEL_PROMPT, batch_prompt: str = BATCH_PROMPT):
+        self.client = client if client is not None else OpenAIClient()
+        self.model = model
+        self.cache = LabelCache(cache) if isinstance(cache, str) else cache
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.backoff = backoff
+        self.batch_size = batch_size
+        self.temperature = temperature
+        self.prompt = prompt
+        self.batch_prompt = batch_prompt
+
+    def _cache_key(self, keywords: Sequence[str]) -> str:
+        # Batched runs answer with batch_prompt (falling back to prompt), single runs with prompt only
+        prompt = self.prompt if self.batch_size <= 1 else f"{self.batch_prompt}\0{self.prompt}"
+        return LabelCache.key(keywords, prompt, self.model)
+
+    async def _complete(self, prompt: str, semaphore: asyncio.Semaphore) -> str:
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with semaphore:
+                    return (await self.client.complete(prompt, self.model, self.temperature)).strip()
+            except Exception:
+                if attempt == self.max_retries:
+                    raise
+                await asyncio.sleep(self.backoff * 2 ** attempt * (0.5 + random.random()))
+
+    async def _label_one(self, comm_id: Hashable, keywords: List[str], semaphore: asyncio.Semaphore) -> Dict:
+        try:
+            return {comm_id: await self._complete(self.prompt.format(keywords=", ".join(keywords)), semaphore)}
+        except Exception as e:
+            print(f"LLM error for community {comm_id}: {e}")
+            return {comm_id: None}
+
+    @staticmethod
+    def _parse_batch(answer: str, n: int) -> Optional[List[str]]:
+        labels = {}
+        for line in answer.splitlines():
+            match = re.match(r"\s*(\d+)[.):]\s*(.+)", line)
+            if match:
+                labels[int(match.group(1))] = match.group(2).strip()
+        if sorted(labels) != list(range(1, n + 1)):
+            return None
+        return [labels[i] for i in range(1, n + 1)]
+
+    async def _label_batch(self, batch: List[tuple], semaphore: asyncio.Semaphore) -> Dict:
+        if len(batch) == 1:
+            return await self._label_one(*batch[0], semaphore)
+        lists = "\n".join(f"{i}. {', '.join(keywords)}" for i, (_, keywords) in enumerate(batch, 1))
+        try:
+            labels = self._parse_batch(await self._complete(self.batch_prompt.format(lists=lists), semaphore), len(batch))
+        except Exception as e:
+            print(f"LLM error for batch of communities {[comm_id for comm_id, _ in batch]}: {e}")
+            labels = None
+        if labels is not None:
+            return {comm_id: label for (comm_id, _), label in zip(batch, labels)}
+        results = await asyncio.gather(*(self._label_one(comm_id, keywords, semaphore) for comm_id, keywords in batch))
+        return {comm_id: label for result in results for comm_id, label in result.items()}
+
+    async def alabel(self, keywords_by_comm: Dict[Hashable, List[str]]) -> Dict[Hashable, str]:
+        labels, pending = {}, []
+        for comm_id, keywords in keywords_by_comm.items():
+            if not keywords:
+                labels[comm_id] = f"Topic {comm_id}"
+                continue
+            cached = self.cache.get(self._cache_key(keywords)) if self.cache is not None else None
+            if cached is not None:
+                labels[comm_id] = cached
+            else:
+                pending.append((comm_id, keywords))
+
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        batches = [pending[i:i + self.batch_size] for i in range(0, len(pending), max(1, self.batch_size))]
+        results = await asyncio.gather(*(self._label_batch(batch, semaphore) for batch in batches))
+        keywords_of = dict(pending)
+        for result in results:
+            for comm_id, label in result.items():
+                if label is None:
+                    labels[comm_id] = f"Topic {comm_id}"
+                    continue
+                labels[comm_id] = label
+                if self.cache is not None:
+                    self.cache.put(self._cache_key(keywords_of[comm_id]), label)
+        return {comm_id: labels[comm_id] for comm_id in keywords_by_comm}
+
+    def label(self, keywords_by_comm: Dict[Hashable, List[str]]) -> Dict[Hashable, str]:
+        """Blocking wrapper around ``alabel``; also works when called from a running event loop."""
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return asyncio.run(self.alabel(keywords_by_comm))
+        # e.g. inside Jupyter: run the labeler's own loop in a separate thread
+        with ThreadPoolExecutor(max_workers=1) as pool:
+            return pool.submit(asyncio.run, self.alabel(keywords_by_comm)).result()
@@ -0,0 +1,122 @@
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Tuple
+
+import numpy as np
+
+
+def window_pairs(ids: np.ndarray, doc_index: np.ndarray, window_size: int) -> Tuple[np.ndarray, np.ndarray]:
+    """``(low, high)`` ids of every token pair less than ``window_size`` apart within one document.
+
+    ``doc_index`` gives the document of each token of the concatenated stream ``ids``.
+    """
+    rows, cols = [], []
+    for offset in range(1, window_size):
+        same_doc = doc_index[:-offset] == doc_index[offset:]
+        if not same_doc.any():
+            break
+        left, right = ids[:-offset][same_doc], ids[offset:][same_doc]
+        rows.append(np.minimum(left, right))
+        cols.append(np.maximum(left, right))
+    if not rows:
+        return np.empty(0, dtype=ids.dtype), np.empty(0, dtype=ids.dtype)
+    return np.concatenate(rows), np.concatenate(cols)
+
+
+def _chunk_bounds(lengths: np.ndarray, chunk_tokens: int) -> List[Tuple[int, int, int, int]]:
+    """Split documents into runs of about ``chunk_tokens`` tokens: ``(first_doc, last_doc, start, stop)``."""
+    ends = np.cumsum(lengths)
+    total = int(ends[-1]) if len(ends) else 0
+    cuts = np.searchsorted(ends, np.arange(chunk_tokens, total, chunk_tokens)) + 1
+    doc_bounds = np.unique(np.concatenate([[0], cuts, [len(lengths)]]))
+    token_bounds = np.concatenate([[0], ends])[doc_bounds]
+    return [
+        (int(doc_bounds[i]), int(doc_bounds[i + 1]), int(token_bounds[i]), int(token_bounds[i + 1]))
+        for i in range(len(doc_bounds) - 1)
+    ]
+
+
+def _replicate_exceedances(ids: np.ndarray, lengths: np.ndarray, pair_keys: np.ndarray, observed: np.ndarray,
+                           size: int, window_size: int, seeds: List[np.random.SeedSequence],
+                           chunk_tokens: int) -> np.ndarray:
+    """Worker: for each seed, shuffle tokens within documents and recount the pairs ``pair_keys``
+    (sorted ``low * size + high``). Returns a ``(3, n_pairs)`` array: how often the null count
+    reached ``observed``, and the sum and sum of squares of the null counts."""
+    exceedances = np.zeros(len(pair_keys), dtype=np.int64)
+    null_sum = np.zeros(len(pair_keys), dtype=np.float64)
+    null_sumsq = np.zeros(len(pair_keys), dtype=np.float64)
+    chunks = _chunk_bounds(lengths, chunk_tokens)
+    for seed in seeds:
+        rng = np.random.default_rng(seed)
+        null_counts = np.zeros(len(pair_keys), dtype=np.int64)
+        # Windows never cross documents, so chunks at document boundaries can be counted separately
+        for first_doc, last_doc, start, stop in chunks:
+            doc_index = np.repeat(np.arange(first_doc, last_doc), lengths[first_doc:last_doc])
+            shuffled = ids[start:stop][np.lexsort((rng.random(stop - start), doc_index))]
+            low, high = window_pairs(shuffled, doc_index, window_size)
+            keys, key_counts = np.unique(low.astype(np.int64) * size + high, return_counts=True)
+            pos = np.searchsorted(pair_keys, keys)
+            tested = pos < len(pair_keys)
+            tested[tested] = pair_keys[pos[tested]] == keys[tested]
+            null_counts[pos[tested]] += key_counts[tested]
+        exceedances += null_counts >= observed
+        null_sum += null_counts
+        null_sumsq += null_counts.astype(np.float64) ** 2
+    return np.stack([exceedances, null_sum, null_sumsq])
+
+
+def permutation_pvalues(ids: np.ndarray, lengths: np.ndarray, rows: np.ndarray, cols: np.ndarray,
+                        observed: np.ndarray, size: int, window_size: int, n_replicates: int = 200,
+                        n_workers: int = 1, seed: int = 0, chunk_tokens: int = 500_000,
+                        tail_approximation: bool = True) -> np.ndarray:
+    """Empirical p-values of pair counts against a within-document shuffle null model.
+
+    Each replicate permutes the token order inside every document, which keeps word frequencies
+    and document composition fixed, and recounts the window pairs ``(rows, cols)`` (with
+    ``rows <= cols``). The one-sided p-value of a pair is ``(1 + #{null >= observed}) / (1 + n_replicates)``,
+    so without ``tail_approximation`` the smallest attainable p-value is ``1 / (1 + n_replicates)`` and
+    ``n_replicates`` trades accuracy against runtime.
+
+    That floor is usually far above what a multiple-testing correction over thousands of pairs
+    requires. With ``tail_approximation`` (the default) a pair that no replicate reached gets instead
+    the normal tail probability of its count under the replicates' mean and variance, if that is
+    smaller, so p-values can fall below the floor.
+
+    Replicates are spread over ``n_workers`` processes; each has its own seed derived from ``seed``,
+    so results do not depend on the number of workers.
+    """
+    keys = rows.astype(np.int64) * size + cols
+    order = np.argsort(keys)
+    pair_keys, sorted_observed = keys[order], observed[order]
+    seeds = np.random.SeedSequence(seed).spawn(n_replicates)
+    n_tasks = max(1, min(n_workers, n_replicates))
+    tasks = [list(task) for task in np.array_split(np.array(seeds, dtype=object), n_tasks)]
+    args = (ids, lengths, pair_keys, sorted_observed, size, window_size)
+    if n_tasks == 1:
+        exceedances, null_sum, null_sumsq = _replicate_exceedances(*args, tasks[0], chunk_tokens)
+    else:
+        with ProcessPoolExecutor(max_workers=n_tasks) as pool:
+            futures = [pool.submit(_replicate_exceedances, *args, task, chunk_tokens) for task in tasks]
+            exceedances, null_sum, null_sumsq = sum(future.result() for future in futures)
+    sorted_pvalues = (1 + exceedances) / (1 + n_replicates)
+    if tail_approximation:
+        from scipy.stats import norm
+        mean = null_sum / n_replicates
+        std = np.sqrt(np.maximum(null_sumsq / n_replicates - mean ** 2, 0))
+        unreached = (exceedances == 0) & (std > 0)
+        tail = norm.sf((sorted_observed[unreached] - mean[unreached]) / std[unreached])
+        sorted_pvalues[unreached] = np.minimum(sorted_pvalues[unreached], tail)
+    pvalues = np.empty(len(keys), dtype=np.float64)
+    pvalues[order] = sorted_pvalues
+    return pvalues
+
+
+def benjamini_hochberg(pvalues: np.ndarray) -> np.ndarray:
+    """Benjamini-Hochberg adjusted p-values (q-values) controlling the false discovery rate."""
+    m = len(pvalues)
+    if m == 0:
+        return np.empty(0, dtype=np.float64)
+    order = np.argsort(pvalues)
+    scaled = pvalues[order] * m / np.arange(1, m + 1)
+    qvalues = np.empty(m, dtype=np.float64)
+    qvalues[order] = np.minimum(np.minimum.accumulate(scaled[::-1])[::-1], 1.0)
+    return qvalues
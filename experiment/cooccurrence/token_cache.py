@@ -0,0 +1,103 @@
+import hashlib
+import json
+import sqlite3
+import weakref
+from typing import Dict, List, Optional
+
+# SQLite limits the number of bound parameters per statement
+_SQLITE_MAX_PARAMS = 500
+
+
+class TokenCache:
+    """Content-addressed store of preprocessed token lists, backed by SQLite.
+
+    Entries are keyed by a hash of the document text together with a fingerprint of the
+    preprocessing config, so changing stopwords, exclusions or POS tags never serves stale tokens.
+
+    Single ``put`` calls are buffered and committed ``commit_every`` at a time (and on ``flush``,
+    ``close``, garbage collection or interpreter exit), so per-document callers do not pay for one
+    commit each.
+    """
+
+    def __init__(self, path: str = "token_cache.sqlite", commit_every: int = 256):
+        self.path = path
+        self.commit_every = commit_every
+        self._pending: Dict[str, List[str]] = {}
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS tokens (key TEXT PRIMARY KEY, tokens TEXT NOT NULL)")
+        self.conn.commit()
+        # Writes pending entries and closes the connection once the cache is closed or collected;
+        # holds the connection and buffer, not the cache, so unused caches can still be collected
+        self._finalizer = weakref.finalize(self, TokenCache._finish, self.conn, self._pending)
+
+    # Connections cannot be pickled; worker processes reopen the same file instead
+    def __getstate__(self):
+        self.flush()
+        return {"path": self.path, "commit_every": self.commit_every}
+
+    def __setstate__(self, state):
+        self.__init__(state["path"], state["commit_every"])
+
+    def __len__(self) -> int:
+        self.flush()
+        return self.conn.execute("SELECT COUNT(*) FROM tokens").fetchone()[0]
+
+    @staticmethod
+    def config_fingerprint(**config) -> str:
+        normalized = {
+            key: sorted(value) if isinstance(value, (set, frozenset)) else value
+            for key, value in config.items()
+        }
+        return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def document_key(text: str, fingerprint: str) -> str:
+        return hashlib.sha256(f"{fingerprint}\0{text}".encode("utf-8")).hexdigest()
+
+    def get(self, key: str) -> Optional[List[str]]:
+        if key in self._pending:
+            return self._pending[key]
+        row = self.conn.execute("SELECT tokens FROM tokens WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[str]]:
+        found = {key: self._pending[key] for key in keys if key in self._pending}
+        for start in range(0, len(keys), _SQLITE_MAX_PARAMS):
+            chunk = keys[start:start + _SQLITE_MAX_PARAMS]
+            placeholders = ",".join("?" * len(chunk))
+            rows = self.conn.execute(f"SELECT key, tokens FROM tokens WHERE key IN ({placeholders})", chunk)
+            for key, tokens in rows:
+                found[key] = json.loads(tokens)
+        return found
+
+    def put(self, key: str, tokens: List[str]):
+        self._pending[key] = tokens
+        if len(self._pending) >= self.commit_every:
+            self.flush()
+
+    def put_many(self, items: Dict[str, List[str]]):
+        """Write ``items`` together with any buffered entries in a single commit."""
+        self._pending.update(items)
+        self.flush()
+
+    @staticmethod
+    def _write(conn: sqlite3.Connection, pending: Dict[str, List[str]]):
+        if not pending:
+            return
+        conn.executemany(
+            "INSERT OR REPLACE INTO tokens (key, tokens) VALUES (?, ?)",
+            ((key, json.dumps(tokens)) for key, tokens in pending.items()),
+        )
+        conn.commit()
+        pending.clear()
+
+    @staticmethod
+    def _finish(conn: sqlite3.Connection, pending: Dict[str, List[str]]):
+        TokenCache._write(conn, pending)
+        conn.close()
+
+    def flush(self):
+        self._write(self.conn, self._pending)
+
+    def close(self):
+        self._finalizer()
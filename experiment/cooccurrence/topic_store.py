@@ -0,0 +1,100 @@
+import json
+import os
+from typing import Dict, List
+
+import networkx as nx
+import numpy as np
+
+FORMAT_VERSION = 1
+
+
+def _string_table(strings: List[str]) -> Dict[str, np.ndarray]:
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    offsets[1:] = np.cumsum([len(s) for s in encoded])
+    return {
+        "strings": np.frombuffer(b"".join(encoded), dtype=np.uint8),
+        "string_offsets": offsets,
+    }
+
+
+def _community_postings(community_documents: Dict[int, np.ndarray]) -> Dict[str, np.ndarray]:
+    topic_ids = np.array(sorted(community_documents), dtype=np.int64)
+    doc_ids = [np.asarray(community_documents[topic], dtype=np.int64) for topic in topic_ids.tolist()]
+    return {
+        "topic_ids": topic_ids,
+        "indptr": np.concatenate([[0], np.cumsum([len(docs) for docs in doc_ids], dtype=np.int64)]),
+        "doc_ids": np.concatenate(doc_ids) if doc_ids else np.empty(0, dtype=np.int64),
+    }
+
+
+def export_topic_store(graph: nx.Graph, path: str, index=None) -> Dict[str, np.ndarray]:
+    """Write the dashboard's view of a topic graph as a directory of memory-mappable ``.npy`` columns.
+
+    Nodes are sorted by name so a name lookup is a binary search over the string table, whose first
+    ``n_nodes`` entries are the node names (keywords that are not nodes follow). Columns:
+
+    - ``strings``/``string_offsets``: UTF-8 string table
+    - ``blocks``: ``(n_levels, n_nodes)`` community per level (row order in ``meta.json``; -1 if unassigned)
+    - ``degree``, ``keyword_indptr``/``keyword_ids``: per-node degree and keyword string ids
+    - ``edge_src``/``edge_dst``/``edge_weight``: co-occurrence edges between node ids
+    - ``L{level}_topic_ids``/``_indptr``/``_doc_ids``: document postings per community, taken from
+      ``index`` (a TopicDocumentIndex, ranked) or else ``graph.graph['community_documents']``
+
+    Document text stays in the corpus recorded as ``corpus_path`` in ``meta.json``. Returns the arrays.
+    """
+    nodes = sorted(graph.nodes)
+    node_index = {node: idx for idx, node in enumerate(nodes)}
+    levels = sorted({int(level) for _, data in graph.nodes(data=True) for level in data.get("levels", {})})
+    level_rows = {level: row for row, level in enumerate(levels)}
+
+    blocks = np.full((len(levels), len(nodes)), -1, dtype=np.int64)
+    for node, data in graph.nodes(data=True):
+        for level, comm in data.get("levels", {}).items():
+            blocks[level_rows[level], node_index[node]] = comm
+
+    extra_strings = sorted({
+        keyword for _, data in graph.nodes(data=True)
+        for keyword in data.get("keywords", []) if keyword not in node_index
+    })
+    string_index = {**node_index, **{s: len(nodes) + i for i, s in enumerate(extra_strings)}}
+    keyword_ids = [[string_index[keyword] for keyword in graph.nodes[node].get("keywords", [])] for node in nodes]
+
+    n_edges = graph.number_of_edges()
+    edges = graph.edges(data="weight", default=1)
+    arrays = {
+        **_string_table(nodes + extra_strings),
+        "blocks": blocks,
+        "degree": np.fromiter((graph.degree(node) for node in nodes), dtype=np.int64, count=len(nodes)),
+        "keyword_indptr": np.concatenate([[0], np.cumsum([len(ids) for ids in keyword_ids], dtype=np.int64)]),
+        "keyword_ids": np.fromiter((i for ids in keyword_ids for i in ids), dtype=np.int64),
+        "edge_src": np.fromiter((node_index[u] for u, _, _ in edges), dtype=np.int64, count=n_edges),
+        "edge_dst": np.fromiter((node_index[v] for _, v, _ in edges), dtype=np.int64, count=n_edges),
+        "edge_weight": np.fromiter((w for _, _, w in edges), dtype=np.float64, count=n_edges),
+    }
+
+    if index is not None:
+        postings = dict(index.levels)
+    else:
+        postings = {
+            level: _community_postings(comm_docs)
+            for level, comm_docs in graph.graph.get("community_documents", {}).items()
+        }
+    for level, level_postings in postings.items():
+        for name in ("topic_ids", "indptr", "doc_ids"):
+            arrays[f"L{level}_{name}"] = level_postings[name]
+
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        np.save(os.path.join(path, f"{name}.npy"), array)
+    meta = {
+        "format_version": FORMAT_VERSION,
+        "n_nodes": len(nodes),
+        "levels": levels,
+        "document_levels": sorted(int(level) for level in postings),
+        "ranked_documents": index is not None,
+        "corpus_path": graph.graph.get("corpus_path"),
+    }
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f, indent=2)
+    return arrays
@@ -1,5 +1,4 @@
 from typing import Dict, List
-from graph_tool.all import minimize_nested_blockmodel_dl
 import networkx as nx
 import plotly.graph_objects as go
 import fitz  # PyMuPDF
@@ -17,37 +16,19 @@ HEADER_PATTERNS = [
 ]
 
 
-def extract_block_levels(nx_graph: nx.Graph) -> List[Dict[str, int]]:
-    # Convert to graph-tool format
-    import graph_tool.all as gt
-    gt_graph = gt.Graph(directed=False)
-    vprop = gt_graph.new_vertex_property("string")
-    idx_map = {}
+def extract_block_levels(nx_graph: nx.Graph, cache_path: str = None, **fit_options) -> List[Dict[str, int]]:
+    """Fit a nested blockmodel and map node labels to block ids at each level.
 
-    for node in nx_graph.nodes:
-        v = gt_graph.add_vertex()
-        idx_map[node] = v
-        vprop[v] = node
-
-    for u, v in nx_graph.edges:
-        if u in idx_map and v in idx_map:
-            gt_graph.add_edge(idx_map[u], idx_map[v])
-
-    gt_graph.vp["name"] = vprop
-
-    # Fit nested block model
-    state = minimize_nested_blockmodel_dl(gt_graph)
-    levels = state.get_levels()  # List of BlockState objects from top to bottom
-
-    # Map node labels to block ids at each level
-    name_prop = gt_graph.vp["name"]
-    block_levels = []
-    for level_state in levels:
-        blocks = level_state.get_blocks()
-        word_to_block = {name_prop[v]: int(blocks[v]) for v in gt_graph.vertices()}
-        block_levels.append(word_to_block)
+    ``fit_options`` are passed to HSBMCommunityModel (``edge_covariate``, ``rec_type``,
+    ``mcmc_niter``, ``refine_sweeps``, ``refine_niter``) to fit a weighted model or
+    change the refinement budget. With ``cache_path`` a previously persisted fit of the
+    same graph is reused. Build an HSBMCommunityModel directly to also keep the state.
+    """
+    from cooccurrence import HSBMCommunityModel
 
-    return block_levels
+    model = HSBMCommunityModel(nx_graph, **fit_options)
+    model.fit(cache_path=cache_path)
+    return model.block_levels()
 
 def remove_frequent_lines(lines, threshold=0.02):
     line_counts = Counter(lines)
@@ -100,25 +81,33 @@ def normalize_text(text: str) -> str:
     return text.strip()
 
 
-def persist_pdf_text_to_corpus(pdf_path: str, corpus_path: str):
+def persist_pdf_text_to_corpus(pdf_path: str, corpus_path: str) -> List[str]:
     """
     Extracts text from a PDF, normalizes it, and appends it to corpus.txt.
+    Returns the appended lines, ready for CooccurrenceGraphBuilder.update().
     """
     paragraphs = extract_text_from_pdf(pdf_path)
+    appended = []
     with open(corpus_path, 'a', encoding='utf-8') as f:
         for para in paragraphs:
             norm = normalize_text(para)
             if norm:
                 f.write(norm + "\n")
+                appended.append(norm + "\n")
+    return appended
 
 
-def persist_docx_text_to_corpus(docx_path: str, corpus_path: str):
+def persist_docx_text_to_corpus(docx_path: str, corpus_path: str) -> List[str]:
     """
     Extracts text from a DOCX file, normalizes it, and appends it to corpus.txt.
+    Returns the appended lines, ready for CooccurrenceGraphBuilder.update().
     """
     paragraphs = extract_text_from_docx(docx_path)
+    appended = []
     with open(corpus_path, 'a', encoding='utf-8') as f:
         for para in paragraphs:
             norm = normalize_text(para)
             if norm:
                 f.write(norm + "\n")
+                appended.append(norm + "\n")
+    return appended